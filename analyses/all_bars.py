@@ -1,11 +1,102 @@
 import numpy as np
 import pandas as pd
-from pptx import Presentation
-from io import BytesIO
 import matplotlib.pyplot as plt
 from pptx.util import Inches
+from report_utils import StreamingDeck, EncodingPipeline, FigurePool, ImageCache, cache_key, cached_tight_layout, column_digest, figure_to_png, profile_columns, validate_image_options
 
-def all_bars(data: pd.core.frame.DataFrame, unique_levels: int = 10, save_to_ppt: bool = False, add_labels: bool = False, ppt_filename: str = 'output.pptx', bar_color: str = 'skyblue', plots_at_a_time: int = 'all', label_font_size: int = 10) -> None:
+def count_levels(data: pd.core.frame.DataFrame, cols: list, max_columns: int = 64, max_cells: int = 2**24) -> dict:
+    """
+    Count the levels of every column in `cols` with a single np.bincount per block of columns.
+
+    Each column is factorized to sorted integer codes and shifted into its own slot range of a shared 2D code
+    array, so one bincount over the array yields the counts of all columns in the block. Missing values get a
+    slot of their own that is dropped, like value_counts() does.
+
+    :param data: Input DataFrame
+    :param cols: Columns to count
+    :param max_columns: Maximum number of columns counted per bincount (default: 64)
+    :param max_cells: Maximum number of codes in the code array, which takes 8 bytes per code. Long frames are
+                      counted fewer columns at a time, down to one (default: 2**24)
+    :return: Dictionary mapping each column to a (levels, counts) tuple of arrays in sorted level order
+    """
+    result = {}
+    block_columns = max(1, min(max_columns, max_cells // max(len(data), 1)))
+    for start in range(0, len(cols), block_columns):
+        block = cols[start:start + block_columns]
+        codes = np.empty((len(data), len(block)), dtype=np.int64)
+        slots = []
+        offset = 0
+        for j, col in enumerate(block):
+            col_codes, levels = pd.factorize(data[col], sort=True)
+            codes[:, j] = np.where(col_codes < 0, len(levels), col_codes) + offset
+            slots.append((col, levels, offset))
+            offset += len(levels) + 1
+
+        counts = np.bincount(codes.ravel(), minlength=offset)
+        for col, levels, col_offset in slots:
+            result[col] = (np.asarray(levels), counts[col_offset:col_offset + len(levels)])
+    return result
+
+def get_cols_to_plot(data: pd.core.frame.DataFrame, unique_levels: int) -> list:
+    """
+    Return the columns of `data` with at most `unique_levels` distinct values.
+    """
+    profile = profile_columns(data, unique_levels + 1)
+    return list(profile.index[profile['n_distinct'] <= unique_levels])
+
+def set_plot_properties(ax, col):
+    ax.set_ylabel('Count')
+    ax.set_xlabel(col)
+    ax.set_title(f'{col} Value Counts')
+
+def create_bar_plot(levels, counts, col, add_labels=False, bar_color='skyblue', label_font_size=10, pool=None):
+    """
+    Draw the bar chart of one column from its level and count arrays and return the laid out Figure.
+
+    With a report_utils.FigurePool the figure is taken from the pool instead of created with plt.subplots.
+    """
+    fig, ax = plt.subplots() if pool is None else pool.subplots()
+    ax.bar(np.arange(len(counts)), counts, width=0.5, color=bar_color)
+    ax.set_xticks(np.arange(len(counts)))
+    ax.set_xticklabels([str(level) for level in levels], rotation=90)
+    set_plot_properties(ax, col)
+
+    if add_labels:
+        for j, v in enumerate(counts):
+            ax.text(j, v + 0.5, str(v), ha='center', va='bottom', fontsize=label_font_size)
+
+    cached_tight_layout(fig)
+    return fig
+
+def iter_bars(data: pd.core.frame.DataFrame, unique_levels: int = 10, add_labels: bool = False, bar_color: str = 'skyblue', label_font_size: int = 10, as_png: bool = False, max_columns: int = 64):
+    """
+    Lazily generate the bar charts all_bars would make, one column at a time and without blocking on input.
+
+    Counts are computed for `max_columns` columns at a time as the generator advances, so stopping early skips
+    the remaining work.
+
+    :param data: Input DataFrame
+    :param unique_levels: Maximum number of unique levels a column can have to be plotted (default: 10)
+    :param add_labels: Boolean indicating whether to add labels to the bars (default: False)
+    :param bar_color: Color of the bars in the plot (default: 'skyblue')
+    :param label_font_size: Font size of the labels on the bars (default: 10)
+    :param as_png: Boolean indicating whether to yield PNG bytes instead of open Figures (default: False)
+    :param max_columns: Number of columns counted per batch (default: 64)
+    :return: Generator of (metadata, plot) tuples, where metadata holds the 'column' and its 'index' and plot is a
+             matplotlib Figure (which the caller should close) or its PNG bytes
+    """
+    if not isinstance(data, pd.core.frame.DataFrame):
+        raise ValueError("The input data is not a valid pandas DataFrame.")
+
+    cols_to_plot = get_cols_to_plot(data, unique_levels)
+    pool = FigurePool() if as_png else None
+    for start in range(0, len(cols_to_plot), max_columns):
+        level_counts = count_levels(data, cols_to_plot[start:start + max_columns], max_columns)
+        for i, (col, (levels, counts)) in enumerate(level_counts.items(), start=start):
+            fig = create_bar_plot(levels, counts, col, add_labels, bar_color, label_font_size, pool)
+            yield {'index': i, 'column': col}, figure_to_png(fig, pool) if as_png else fig
+
+def all_bars(data: pd.core.frame.DataFrame, unique_levels: int = 10, save_to_ppt: bool = False, add_labels: bool = False, ppt_filename: str = 'output.pptx', bar_color: str = 'skyblue', plots_at_a_time: int = 'all', label_font_size: int = 10, cache_dir: str = None, cache_max_bytes: int = 512 * 2**20, resume: bool = False, checkpoint_dir: str = None, image_format: str = 'png', compress_level: int = 6, jpeg_quality: int = 90, encode_threads: int = None, slide_dpi: float = None, quantize_colors: int = None) -> None:
     """
     Plot bar charts for columns in a DataFrame with a specified number of unique levels or fewer.
 
@@ -15,71 +106,112 @@ def all_bars(data: pd.core.frame.DataFrame, unique_levels: int = 10, save_to_ppt
     :param add_labels: Boolean indicating whether to add labels to the bars (default: False)
     :param ppt_filename: Name of the PowerPoint file to save (if save_to_ppt is True) (default: 'output.pptx')
     :param bar_color: Color of the bars in the plot (default: 'skyblue')
-    :param plots_at_a_time: Number of plots to show at a time, use 'all' to show all plots at once (default: 'all')
+    :param plots_at_a_time: Number of plots to show at a time when displaying them, use 'all' to show all plots at once.
+                            Use iter_bars to page through the plots without blocking on input (default: 'all')
     :param label_font_size: Font size of the labels on the bars (default: 10)
+    :param cache_dir: Directory of rendered slide images reused across runs when save_to_ppt is True. Slides are keyed
+                      by a hash of the column contents and the render parameters, so a rerun only renders the
+                      columns that changed (default: None, no cache)
+    :param cache_max_bytes: Size above which the least recently used cached images are evicted (default: 512 MiB)
+    :param resume: Boolean indicating whether to pick up an interrupted save_to_ppt run with the same columns and
+                   parameters from its checkpoint instead of starting over (default: False)
+    :param checkpoint_dir: Directory in which a 'deck_checkpoint' subdirectory keeps the progress journal and spooled
+                           slide images while saving to PowerPoint; only that subdirectory is removed once the deck is
+                           saved (default: None, '<ppt_filename>.checkpoint')
+    :param image_format: Slide image format, 'png' or 'jpeg' (smaller and faster to encode, but lossy) (default: 'png')
+    :param compress_level: PNG zlib compression level from 0 (fastest, largest) to 9 (slowest, smallest) (default: 6)
+    :param jpeg_quality: JPEG quality from 1 to 95 when image_format is 'jpeg' (default: 90)
+    :param encode_threads: Number of threads encoding slide images while the next plot is drawn (default: None, up to 4)
+    :param slide_dpi: Pixels per inch of the slide images at their size on the slide, e.g. 150 for sharp but small
+                      decks (default: None, render at the figure's own dpi)
+    :param quantize_colors: Reduce PNG slide images to a palette of this many colors (2-256), which shrinks them
+                            several times over with no visible change for flat-colored plots (default: None)
     """
-    def set_plot_properties(ax, col):
-        ax.set_ylabel('Count')
-        ax.set_xlabel(col)
-        ax.set_title(f'{col} Value Counts')
-
     if not isinstance(data, pd.core.frame.DataFrame):
         print("The input data is not a valid pandas DataFrame.")
         return
 
-    cols_to_plot = [col for col in data.columns if (nunique := data[col].nunique()) <= unique_levels]
+    try:
+        validate_image_options(image_format, slide_dpi, quantize_colors)
+    except ValueError as e:
+        print(e)
+        return
+
+    cols_to_plot = get_cols_to_plot(data, unique_levels)
 
     if not cols_to_plot:
         print("No columns to plot.")
         return
 
+    completed = set()
+    pool = None
     if save_to_ppt:
-        prs = Presentation()
+        # Hashed once and shared by the run key and the slide cache keys.
+        digests = {col: column_digest(data[col]) for col in cols_to_plot}
+        run_key = cache_key('all_bars', cols_to_plot, data.shape, *digests.values(),
+                            add_labels, bar_color, label_font_size, image_format, slide_dpi, quantize_colors)
+        prs = StreamingDeck(checkpoint_dir=checkpoint_dir or f'{ppt_filename}.checkpoint', run_key=run_key, resume=resume)
+        completed = prs.completed
+        pool = FigurePool()
+        pipeline = EncodingPipeline(prs, encode_threads, image_format, compress_level, jpeg_quality, pool, slide_dpi,
+                                    quantize_colors)
 
     num_plots = len(cols_to_plot)
     if plots_at_a_time == 'all':
         plots_at_a_time = num_plots
 
+    cached_cols = set()
+    if save_to_ppt and cache_dir is not None:
+        image_cache = ImageCache(cache_dir, cache_max_bytes, image_format)
+        slide_keys = {col: cache_key(col, digests[col], add_labels, bar_color, label_font_size,
+                                     image_format, compress_level, jpeg_quality, slide_dpi, quantize_colors)
+                      for col in cols_to_plot}
+        cached_cols = {col for col, key in slide_keys.items() if key in image_cache}
+        print(f'Reusing {len(cached_cols)} of {num_plots} slides from {cache_dir}')
+
+    level_counts = count_levels(data, [col for i, col in enumerate(cols_to_plot, start=1)
+                                       if col not in cached_cols and i not in completed])
+
     for i, col in enumerate(cols_to_plot, start=1):
-        counts = data[col].value_counts().sort_index()
-        ax = counts.plot(kind='bar', color=bar_color)
-        set_plot_properties(ax, col)
-        
-        if add_labels:
-            for j, v in enumerate(counts):
-                ax.text(j, v + 0.5, str(v), ha='center', va='bottom', fontsize=label_font_size)
+        if i in completed:
+            continue
+
+        image = image_cache.get(slide_keys[col]) if col in cached_cols else None
+        if image is not None:
+            left = top = Inches(1)
+            pipeline.add(image, left, top, Inches(4.5), Inches(4.5), key=i)
+            continue
+
+        levels, counts = level_counts[col] if col in level_counts else count_levels(data, [col])[col]
+        fig = create_bar_plot(levels, counts, col, add_labels, bar_color, label_font_size, pool)
 
         if save_to_ppt:
-            img_stream = BytesIO()
-            plt.tight_layout()
-            plt.savefig(img_stream, format='png')
-            plt.close()
-            slide_layout = prs.slide_layouts[5]
-            slide = prs.slides.add_slide(slide_layout)
             left = top = Inches(1)
-            slide.shapes.add_picture(img_stream, left, top, Inches(4.5), Inches(4.5))
-        else:
-            plt.tight_layout()
-            plt.show()
-        
+            cache_image = None if cache_dir is None else lambda image, key=slide_keys[col]: image_cache.put(key, image)
+            pipeline.add(fig, left, top, Inches(4.5), Inches(4.5), key=i, on_encoded=cache_image)
+            continue
+
+        plt.show()
         if i % plots_at_a_time == 0 and i < num_plots:
             input("Press Enter to see next set of plots...")
             
     if save_to_ppt:
+        pipeline.close()
         prs.save(ppt_filename)
         print(f'Saved PowerPoint file to: {ppt_filename}')
 
 
 # Usage example:
-np.random.seed(123)
+if __name__ == '__main__':
+    np.random.seed(123)
 
-data = {}
-for i in range(65, 75):
-    data[chr(i)] = np.random.choice(list(range(10)), 1000)
+    data = {}
+    for i in range(65, 75):
+        data[chr(i)] = np.random.choice(list(range(10)), 1000)
 
-for i in range(75, 85):
-    data[chr(i)] = np.random.choice(list(range(20)), 1000)
+    for i in range(75, 85):
+        data[chr(i)] = np.random.choice(list(range(20)), 1000)
 
-df = pd.DataFrame(data)
+    df = pd.DataFrame(data)
 
-all_bars(df, unique_levels=10, save_to_ppt=False, add_labels=True, plots_at_a_time=4)
+    all_bars(df, unique_levels=10, save_to_ppt=False, add_labels=True, plots_at_a_time=4)
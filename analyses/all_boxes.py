@@ -1,18 +1,16 @@
 import numpy as np
 import pandas as pd
-from pptx import Presentation
-from io import BytesIO
 import matplotlib.pyplot as plt
 from pptx.util import Inches
+from report_utils import StreamingDeck, EncodingPipeline, FigurePool, cache_key, cached_tight_layout, column_digest, figure_to_png, profile_columns, validate_image_options
 from itertools import combinations
-import seaborn as sns
 
 
 class InvalidInputError(ValueError):
     pass
 
 
-def validate_inputs(data, categorical_min, continuous_max, plots_at_a_time):
+def validate_inputs(data, categorical_min, continuous_max, plots_at_a_time, image_format='png', slide_dpi=None, quantize_colors=None):
     """Validates the inputs for the all_boxes function."""
     if not isinstance(data, pd.core.frame.DataFrame):
         raise InvalidInputError("The input data is not a valid pandas DataFrame.")
@@ -26,10 +24,80 @@ def validate_inputs(data, categorical_min, continuous_max, plots_at_a_time):
     if plots_at_a_time != 'all' and (not isinstance(plots_at_a_time, int) or plots_at_a_time <= 0):
         raise InvalidInputError("plots_at_a_time should be either 'all' or a positive integer.")
 
+    try:
+        validate_image_options(image_format, slide_dpi, quantize_colors)
+    except ValueError as e:
+        raise InvalidInputError(str(e)) from e
+
 
 def get_cols_to_plot(data, categorical_min, continuous_max):
     """Returns columns satisfying categorical_min and continuous_max conditions."""
-    return [col for col in data.columns if data[col].nunique() >= categorical_min and data[col].max() <= continuous_max]
+    profile = profile_columns(data, categorical_min)
+    return list(profile.index[(profile['n_distinct'] >= categorical_min) & (profile['max'] <= continuous_max)])
+
+
+def compute_box_stats(data, group_col, value_cols, whis=1.5, max_columns=16):
+    """
+    Computes box plot statistics of every column in value_cols for each level of group_col.
+
+    group_col is sorted once; quartiles, whiskers and fliers of all value columns are then computed per segment
+    of the sorted rows, max_columns value columns at a time. Returns a dict mapping each value column to a
+    (positions, labels, stats) tuple ready for Axes.bxp.
+    """
+    groups = data[group_col].to_numpy(dtype=float)
+    order = np.argsort(groups, kind='stable')
+    order = order[~np.isnan(groups[order])]
+    sorted_groups = groups[order]
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(sorted_groups)) + 1, [len(order)]))
+    labels = [str(level) for level in data[group_col].to_numpy()[order[bounds[:-1]]]]
+
+    result = {}
+    for start in range(0, len(value_cols), max_columns):
+        cols = value_cols[start:start + max_columns]
+        values = data[cols].to_numpy(dtype=float)[order]
+        level_stats = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            # NaNs sort to the end of each column, so the first `count` rows are the valid values.
+            segment = np.sort(values[lo:hi], axis=0)
+            count = (~np.isnan(segment)).sum(axis=0)
+            columns = np.arange(segment.shape[1])
+
+            def quantile(q):
+                position = np.maximum(count - 1, 0) * q
+                below = np.floor(position).astype(int)
+                above = np.minimum(below + 1, np.maximum(count - 1, 0))
+                low, high = segment[below, columns], segment[above, columns]
+                return low + (high - low) * (position - below)
+
+            q1, med, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+            iqr = q3 - q1
+            with np.errstate(invalid='ignore'):
+                n_low = (segment < q1 - whis * iqr).sum(axis=0)
+                n_high = (segment <= q3 + whis * iqr).sum(axis=0)
+            whislo = np.fmin(segment[np.minimum(n_low, len(segment) - 1), columns], q1)
+            whishi = np.fmax(segment[np.maximum(n_high - 1, 0), columns], q3)
+            mean = np.nansum(segment, axis=0) / np.maximum(count, 1)
+            level_stats.append((count, q1, med, q3, whislo, whishi, mean, n_low, n_high, segment))
+
+        for j, col in enumerate(cols):
+            positions, stats = [], []
+            for position, (count, q1, med, q3, whislo, whishi, mean, n_low, n_high, segment) in enumerate(level_stats):
+                if count[j] == 0:
+                    continue
+                fliers = np.concatenate((segment[:n_low[j], j], segment[n_high[j]:count[j], j]))
+                positions.append(position)
+                stats.append({'med': med[j], 'q1': q1[j], 'q3': q3[j], 'whislo': whislo[j], 'whishi': whishi[j],
+                              'mean': mean[j], 'fliers': fliers})
+            result[col] = (positions, labels, stats)
+    return result
+
+
+def draw_box_stats(ax, positions, labels, stats):
+    """Draws precomputed box plot statistics on ax, one box per group level."""
+    ax.bxp(stats, positions=positions, patch_artist=True, boxprops={'facecolor': 'C0'},
+           medianprops={'color': 'black'}, flierprops={'marker': 'd', 'markersize': 4})
+    ax.set_xticks(range(len(labels)))
+    ax.set_xticklabels(labels)
 
 
 def set_plot_properties(ax, col1, col2):
@@ -39,15 +107,60 @@ def set_plot_properties(ax, col1, col2):
     ax.set_title(f'Box Plot of {col1} and {col2}')
 
 
-def save_plot_to_ppt(prs, img_stream):
-    """Saves the plot to PowerPoint presentation."""
-    slide_layout = prs.slide_layouts[5]
-    slide = prs.slides.add_slide(slide_layout)
+def save_plot_to_ppt(pipeline, plot, key=None):
+    """Queues the plot, a figure or encoded image, for the PowerPoint presentation."""
     left = top = Inches(1)
-    slide.shapes.add_picture(img_stream, left, top, Inches(4.5), Inches(4.5))
+    pipeline.add(plot, left, top, Inches(4.5), Inches(4.5), key=key)
+
+
+def _generate_box_plots(data, cols_to_plot, as_png, skip=(), pool=None):
+    """
+    Yields (metadata, plot) for every pair of cols_to_plot, computing box statistics once per grouping column.
+
+    Pairs whose index is in skip are not rendered. Figures are taken from pool, a report_utils.FigurePool, if given.
+    """
+    box_stats_col = None
+    for i, (col1, col2) in enumerate(combinations(cols_to_plot, 2)):
+        if i in skip:
+            continue
+        if col1 != box_stats_col:
+            # combinations() groups the pairs by col1, so each grouping column is sorted exactly once.
+            box_stats = compute_box_stats(data, col1, cols_to_plot[cols_to_plot.index(col1) + 1:])
+            box_stats_col = col1
+
+        fig, ax = plt.subplots() if pool is None else pool.subplots()
+        draw_box_stats(ax, *box_stats[col2])
+        set_plot_properties(ax, col1, col2)
+        cached_tight_layout(fig)
+        yield {'index': i, 'x': col1, 'y': col2}, figure_to_png(fig, pool) if as_png else fig
+
+
+def iter_boxes(data, categorical_min=2, continuous_max=100, as_png=False):
+    """
+    Lazily generates the box plots all_boxes would make, one column pair at a time.
+
+    Nothing is rendered until the next item is requested, so callers can stream, page or stop early without
+    blocking on input.
+
+    Parameters:
+    data (pd.DataFrame): The input data frame containing the data to be plotted.
+    categorical_min (int, optional): See all_boxes. Defaults to 2.
+    continuous_max (int, optional): See all_boxes. Defaults to 100.
+    as_png (bool, optional): Whether to yield PNG bytes instead of open matplotlib Figures. Defaults to False.
+
+    Raises:
+    InvalidInputError: If any of the input parameters do not meet their respective conditions.
+
+    Yields:
+    tuple: A metadata dict with the pair ('x', 'y') and its 'index', and the Figure (which the caller should close)
+           or its PNG bytes.
+    """
+    validate_inputs(data, categorical_min, continuous_max, 'all')
+    yield from _generate_box_plots(data, get_cols_to_plot(data, categorical_min, continuous_max), as_png,
+                                  pool=FigurePool() if as_png else None)
 
 
-def all_boxes(data, categorical_min=2, continuous_max=100, save_to_ppt=False, ppt_filename='output.pptx', plots_at_a_time='all'):
+def all_boxes(data, categorical_min=2, continuous_max=100, save_to_ppt=False, ppt_filename='output.pptx', plots_at_a_time='all', resume=False, checkpoint_dir=None, image_format='png', compress_level=6, jpeg_quality=90, encode_threads=None, slide_dpi=None, quantize_colors=None):
     """
     Generates box plots for combinations of columns in the input data frame based on the specified conditions.
     
@@ -65,7 +178,24 @@ def all_boxes(data, categorical_min=2, continuous_max=100, save_to_ppt=False, pp
     ppt_filename (str, optional): The filename to use for saving the PowerPoint presentation if save_to_ppt is True. 
                                   Defaults to 'output.pptx'.
     plots_at_a_time (int or 'all', optional): The number of plots to display at a time if save_to_ppt is False, or 
-                                              'all' to display all plots at once. Defaults to 'all'.
+                                              'all' to display all plots at once. Use iter_boxes to page through the
+                                              plots without blocking on input. Defaults to 'all'.
+    resume (bool, optional): Whether to pick up an interrupted save_to_ppt run with the same columns from its
+                             checkpoint instead of starting over. Defaults to False.
+    checkpoint_dir (str, optional): Directory in which a 'deck_checkpoint' subdirectory keeps the progress journal and
+                                    spooled slide images while saving to PowerPoint; only that subdirectory is removed
+                                    once the deck is saved. Defaults to '<ppt_filename>.checkpoint'.
+    image_format (str, optional): Slide image format, 'png' or 'jpeg' (smaller and faster to encode, but lossy).
+                                  Defaults to 'png'.
+    compress_level (int, optional): PNG zlib compression level from 0 (fastest) to 9 (smallest). Defaults to 6.
+    jpeg_quality (int, optional): JPEG quality from 1 to 95 when image_format is 'jpeg'. Defaults to 90.
+    encode_threads (int, optional): Number of threads encoding slide images while the next plot is drawn.
+                                    Defaults to None, up to 4.
+    slide_dpi (float, optional): Pixels per inch of the slide images at their size on the slide, e.g. 150 for sharp
+                                 but small decks. Defaults to None, rendering at the figure's own dpi.
+    quantize_colors (int, optional): Reduce PNG slide images to a palette of this many colors (2-256), which shrinks
+                                     them several times over with no visible change for flat-colored plots.
+                                     Defaults to None.
     
     Raises:
     InvalidInputError: If any of the input parameters do not meet their respective conditions.
@@ -74,7 +204,7 @@ def all_boxes(data, categorical_min=2, continuous_max=100, save_to_ppt=False, pp
     None
     """
     try:
-        validate_inputs(data, categorical_min, continuous_max, plots_at_a_time)
+        validate_inputs(data, categorical_min, continuous_max, plots_at_a_time, image_format, slide_dpi, quantize_colors)
     except InvalidInputError as e:
         print(e)
         return
@@ -85,53 +215,50 @@ def all_boxes(data, categorical_min=2, continuous_max=100, save_to_ppt=False, pp
         print("No columns to plot.")
         return
 
+    completed = set()
+    pool = None
     if save_to_ppt:
-        prs = Presentation()
+        run_key = cache_key('all_boxes', cols_to_plot, data.shape, *[column_digest(data[col]) for col in cols_to_plot],
+                            image_format, slide_dpi, quantize_colors)
+        prs = StreamingDeck(checkpoint_dir=checkpoint_dir or f'{ppt_filename}.checkpoint', run_key=run_key, resume=resume)
+        completed = prs.completed
+        pool = FigurePool()
+        pipeline = EncodingPipeline(prs, encode_threads, image_format, compress_level, jpeg_quality, pool, slide_dpi,
+                                    quantize_colors)
 
-    column_combinations = list(combinations(cols_to_plot, 2))
-    num_plots = len(column_combinations)
+    num_plots = len(cols_to_plot) * (len(cols_to_plot) - 1) // 2
     if plots_at_a_time == 'all':
         plots_at_a_time = num_plots
 
-    for i, (col1, col2) in enumerate(column_combinations):
-        x = data[col1]
-        y = data[col2]
-
-        fig, ax = plt.subplots()
-
-        sns.boxplot(x=x, y=y, ax=ax)
-        set_plot_properties(ax, col1, col2)
-
-        img_stream = BytesIO()
-        plt.tight_layout()
-        plt.savefig(img_stream, format='png')
+    for i, (metadata, plot) in enumerate(_generate_box_plots(data, cols_to_plot, False, completed, pool)):
         if save_to_ppt:
-            save_plot_to_ppt(prs, img_stream)
-            plt.close()
-        else:
-            plt.show()
+            save_plot_to_ppt(pipeline, plot, metadata['index'])
+            continue
 
+        plt.show()
         if (i+1) % plots_at_a_time == 0 and i < num_plots - 1:
             input("Press Enter to see next set of plots...")
 
     if save_to_ppt:
+        pipeline.close()
         prs.save(ppt_filename)
         print(f'Saved PowerPoint file to: {ppt_filename}')
 
 
 # Usage example
-np.random.seed(123)
-data = {
-    'var1': np.random.choice(list(range(10)), 100),
-    'var2': np.random.choice(list(range(10)), 100),
-    'var3': np.random.choice(list(range(10)), 100),
-    'var4': np.random.choice(list(range(20)), 100),
-    'var5': np.random.choice(list(range(20)), 100),
-    'var6': np.random.choice(list(range(20)), 100),
-    'var7': np.random.choice(list(range(200)), 100),
-    'var8': np.random.choice(list(range(200)), 100),
-    'var9': np.random.choice(list(range(200)), 100),
-    'var10': np.random.choice(list(range(200)), 100)
-}
-df = pd.DataFrame(data)
-all_boxes(df, categorical_min=2, continuous_max=200, save_to_ppt=False, plots_at_a_time=4)
\ No newline at end of file
+if __name__ == '__main__':
+    np.random.seed(123)
+    data = {
+        'var1': np.random.choice(list(range(10)), 100),
+        'var2': np.random.choice(list(range(10)), 100),
+        'var3': np.random.choice(list(range(10)), 100),
+        'var4': np.random.choice(list(range(20)), 100),
+        'var5': np.random.choice(list(range(20)), 100),
+        'var6': np.random.choice(list(range(20)), 100),
+        'var7': np.random.choice(list(range(200)), 100),
+        'var8': np.random.choice(list(range(200)), 100),
+        'var9': np.random.choice(list(range(200)), 100),
+        'var10': np.random.choice(list(range(200)), 100)
+    }
+    df = pd.DataFrame(data)
+    all_boxes(df, categorical_min=2, continuous_max=200, save_to_ppt=False, plots_at_a_time=4)
\ No newline at end of file
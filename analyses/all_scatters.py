@@ -1,13 +1,22 @@
+import os
+from io import BytesIO
 import numpy as np
 import pandas as pd
-from pptx import Presentation
-from io import BytesIO
 import matplotlib.pyplot as plt
-from pptx.util import Inches
-from itertools import combinations
+from matplotlib.colors import LogNorm
+from pptx.util import Emu, Inches
+from PIL import Image
+from report_utils import StreamingDeck, EncodingPipeline, FigurePool, cache_key, cached_tight_layout, column_digest, encode_image, figure_to_png, profile_columns, rasterize_figure, slide_image_dpi, validate_image_options
+from collections import deque
+from itertools import combinations, islice
+from concurrent.futures import ProcessPoolExecutor
 import seaborn as sns
+from scipy.stats import t as t_dist
 
-def validate_inputs(data, unique_levels, plots_at_a_time):
+# Per-process state for the parallel renderer, populated by _init_worker.
+_worker_state = {}
+
+def validate_inputs(data, unique_levels, plots_at_a_time, n_jobs=1, matrix_size=5, top_k=None, min_score=None, rank_by='correlation', density_threshold=None, density_bins=100, image_format='png', slide_dpi=None, quantize_colors=None):
     if not isinstance(data, pd.core.frame.DataFrame):
         raise ValueError("The input data is not a valid pandas DataFrame.")
     
@@ -17,13 +26,187 @@ def validate_inputs(data, unique_levels, plots_at_a_time):
     if plots_at_a_time != 'all' and (not isinstance(plots_at_a_time, int) or plots_at_a_time <= 0):
         raise ValueError("plots_at_a_time should be either 'all' or a positive integer.")
 
+    if n_jobs is not None and (not isinstance(n_jobs, int) or n_jobs <= 0):
+        raise ValueError("n_jobs should be None or a positive integer.")
+
+    if not isinstance(matrix_size, int) or matrix_size < 2:
+        raise ValueError("matrix_size should be an integer of at least 2.")
+
+    if top_k is not None and (not isinstance(top_k, int) or top_k <= 0):
+        raise ValueError("top_k should be None or a positive integer.")
+
+    if min_score is not None and not isinstance(min_score, (int, float)):
+        raise ValueError("min_score should be None or a number.")
+
+    if rank_by not in ('correlation', 'mutual_information'):
+        raise ValueError("rank_by should be either 'correlation' or 'mutual_information'.")
+
+    if density_threshold is not None and (not isinstance(density_threshold, int) or density_threshold < 0):
+        raise ValueError("density_threshold should be None or a non-negative integer.")
+
+    if not isinstance(density_bins, int) or density_bins <= 0:
+        raise ValueError("density_bins should be a positive integer.")
+
+    validate_image_options(image_format, slide_dpi, quantize_colors)
+
 def get_cols_to_plot(data, unique_levels):
-    return [col for col in data.columns if data[col].nunique() >= unique_levels]
+    profile = profile_columns(data, unique_levels)
+    return list(profile.index[profile['n_distinct'] >= unique_levels])
+
+def _mutual_information(joint):
+    """Mutual information of each of a stack of contingency tables."""
+    n = joint.sum(axis=(1, 2), keepdims=True)
+    p_xy = np.divide(joint, n, out=np.zeros(joint.shape), where=n > 0)
+    expected = p_xy.sum(axis=2, keepdims=True) * p_xy.sum(axis=1, keepdims=True)
+    ratio = np.divide(p_xy, expected, out=np.ones_like(p_xy), where=(p_xy > 0) & (expected > 0))
+    return (p_xy * np.log(ratio)).sum(axis=(1, 2))
+
+def binned_mutual_information(data, cols, bins=16, max_cells=2**24):
+    """
+    Mutual information (in nats) between every pair of columns after equal-frequency binning.
+
+    The contingency table of each pair is a bincount of combined bin codes: for every column, the codes of the
+    columns after it are combined with its own and counted in one call per block of at most max_cells codes, which
+    bounds memory. Work grows with rows x pairs rather than with the (columns x bins)^2 of a one-hot product. Rows
+    missing either value of a pair are ignored for that pair.
+    """
+    k, n_rows = len(cols), len(data)
+    # Missing values get an extra last level, which is dropped from the tables.
+    levels = bins + 1
+    cells = levels * levels
+    # Ranked one column at a time: ranking the whole frame at once peaks at several copies of it.
+    codes = np.empty((k, n_rows), dtype=np.int32)
+    for c, col in enumerate(cols):
+        pct = data[col].rank(pct=True).to_numpy()
+        codes[c] = np.where(np.isnan(pct), bins, np.minimum(np.floor(np.nan_to_num(pct) * bins), bins - 1))
+
+    mi = np.zeros((k, k))
+    # A column's information with itself is its entropy, the information of its diagonal table.
+    diagonal = np.zeros((k, bins, bins))
+    for c in range(k):
+        diagonal[c, np.arange(bins), np.arange(bins)] = np.bincount(codes[c], minlength=levels)[:bins]
+    mi[np.arange(k), np.arange(k)] = _mutual_information(diagonal)
 
-def create_scatter_plot(x, y, ax, line_of_best_fit, confidence_interval):
-    if line_of_best_fit:
-        sns.regplot(x=x, y=y, ax=ax, ci=95 if confidence_interval else None, scatter_kws={'s':10})
+    # Shifted in place so that the combined codes of column j land in the j-th block of cells of one bincount.
+    codes += (np.arange(k, dtype=np.int32) * cells)[:, None]
+    pair_start = np.concatenate(([0], np.cumsum(np.arange(k - 1, 0, -1))))
+    tables = np.zeros((pair_start[-1], levels, levels))
+    flat_tables = tables.reshape(-1)
+    block = max(1, max_cells // max(n_rows, 1))
+    buffer = np.empty((min(block, k), n_rows), dtype=np.intp)
+    for i in range(k - 1):
+        own = (codes[i].astype(np.intp) - i * cells) * levels
+        for j0 in range(i + 1, k, block):
+            j1 = min(j0 + block, k)
+            keys = np.add(codes[j0:j1], own, out=buffer[:j1 - j0])
+            counts = np.bincount(keys.ravel(), minlength=j1 * cells)[j0 * cells:]
+            offset = (pair_start[i] + j0 - i - 1) * cells
+            flat_tables[offset:offset + len(counts)] += counts
+
+    i, j = np.triu_indices(k, k=1)
+    # _mutual_information holds about four temporaries the size of its tables.
+    pair_block = max(1, max_cells // (4 * cells))
+    for start in range(0, len(tables), pair_block):
+        stop = start + pair_block
+        mi[i[start:stop], j[start:stop]] = mi[j[start:stop], i[start:stop]] = \
+            _mutual_information(tables[start:stop, :bins, :bins])
+    return pd.DataFrame(mi, index=cols, columns=cols)
+
+def rank_pairs(data, cols, rank_by='correlation', bins=16):
+    """
+    Scores every pair of cols in one vectorized pass and returns them ranked, best first.
+
+    The score is the absolute Pearson correlation, or the binned mutual information when rank_by is
+    'mutual_information'. Only numeric columns are scored: pairs involving a text, category or datetime column
+    score 0.
+    """
+    numeric = [col for col in cols if pd.api.types.is_numeric_dtype(data[col])]
+    corr = data[numeric].corr().reindex(index=cols, columns=cols).fillna(0).to_numpy()
+    i, j = np.triu_indices(len(cols), k=1)
+    ranking = pd.DataFrame({'col1': np.asarray(cols, dtype=object)[i], 'col2': np.asarray(cols, dtype=object)[j],
+                            'correlation': corr[i, j]})
+    if rank_by == 'mutual_information':
+        mi = binned_mutual_information(data, numeric, bins).reindex(index=cols, columns=cols).fillna(0)
+        ranking['mutual_information'] = mi.to_numpy()[i, j]
+        ranking['score'] = ranking['mutual_information']
     else:
+        ranking['score'] = ranking['correlation'].abs()
+    return ranking.sort_values('score', ascending=False, kind='stable').reset_index(drop=True)
+
+def fit_line(x, y, n_points=100, ci=95):
+    """
+    Closed-form OLS fit of y on x with a t-based confidence band for the mean response.
+
+    Everything is derived from the sufficient statistics n, sum(x), sum(y), sum(x^2), sum(xy) and sum(y^2).
+    Returns (grid, fitted, lower, upper), or None when the fit is undefined.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    mask = np.isfinite(x) & np.isfinite(y)
+    x, y = x[mask], y[mask]
+    n = x.size
+    if n < 3:
+        return None
+
+    # Shifting by the first observation leaves the fit unchanged and limits cancellation in the sums.
+    x0, y0 = x[0], y[0]
+    xs, ys = x - x0, y - y0
+    sx, sy = xs.sum(), ys.sum()
+    sxx, sxy, syy = xs @ xs, xs @ ys, ys @ ys
+
+    ss_xx = sxx - sx * sx / n
+    ss_xy = sxy - sx * sy / n
+    ss_yy = syy - sy * sy / n
+    if ss_xx <= 0:
+        return None
+
+    slope = ss_xy / ss_xx
+    intercept = (sy - slope * sx) / n
+    residual_var = max(ss_yy - slope * ss_xy, 0.0) / (n - 2)
+
+    grid = np.linspace(x.min(), x.max(), n_points)
+    fitted = intercept + slope * (grid - x0) + y0
+    se = np.sqrt(residual_var * (1 / n + (grid - x0 - sx / n) ** 2 / ss_xx))
+    margin = t_dist.ppf(0.5 + ci / 200, n - 2) * se
+    return grid, fitted, fitted - margin, fitted + margin
+
+def create_density_plot(x, y, ax, bins=100):
+    """
+    Draws the point density of x and y as a 2D histogram on a log color scale, so the cost depends on the number
+    of bins rather than the number of rows. Returns the mesh, or None when there is nothing to draw.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    mask = np.isfinite(x) & np.isfinite(y)
+    if not mask.any():
+        return None
+    counts, x_edges, y_edges = np.histogram2d(x[mask], y[mask], bins=bins)
+    return ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0), norm=LogNorm(), cmap='viridis', rasterized=True)
+
+def use_density(x, y, density_threshold):
+    """Whether a pair is drawn as a 2D histogram: only numeric pairs with more than density_threshold rows are."""
+    return (density_threshold is not None and len(x) > density_threshold
+            and pd.api.types.is_numeric_dtype(x) and pd.api.types.is_numeric_dtype(y))
+
+def create_scatter_plot(x, y, ax, line_of_best_fit, confidence_interval, bootstrap_ci=False, density_threshold=None, density_bins=100):
+    density = use_density(x, y, density_threshold)
+    if density:
+        mesh = create_density_plot(x, y, ax, density_bins)
+        if mesh is not None:
+            ax.figure.colorbar(mesh, ax=ax, label='Count')
+    if line_of_best_fit and bootstrap_ci:
+        sns.regplot(x=x, y=y, ax=ax, ci=95 if confidence_interval else None, scatter=not density, scatter_kws={'s':10})
+    elif line_of_best_fit:
+        if not density:
+            ax.scatter(x, y, s=10, color='C0')
+        fit = fit_line(x, y)
+        if fit is not None:
+            grid, fitted, lower, upper = fit
+            line_color = 'C1' if density else 'C0'
+            ax.plot(grid, fitted, color=line_color)
+            if confidence_interval:
+                ax.fill_between(grid, lower, upper, color=line_color, alpha=0.15, linewidth=0)
+    elif not density:
         ax.scatter(x, y)
 
 def set_plot_properties(ax, col1, col2):
@@ -31,69 +214,316 @@ def set_plot_properties(ax, col1, col2):
     ax.set_xlabel(col1)
     ax.set_title(f'Scatter Plot of {col1} and {col2}')
 
-def all_scatters(data: pd.core.frame.DataFrame, unique_levels: int = 10, save_to_ppt: bool = False, line_of_best_fit: bool = False, confidence_interval: bool = False, ppt_filename: str = 'output.pptx', plots_at_a_time: int = 'all') -> None:
+def scatter_matrix_pages(cols_to_plot, matrix_size):
+    """
+    Slices the lower triangle of the scatter matrix into pages of at most matrix_size x matrix_size cells.
+
+    Returns a list of (row_cols, col_cols) tuples. Cell (row, col) of a page holds the pair (col_cols[col], row_cols[row])
+    whenever that pair comes up in combinations(cols_to_plot, 2); diagonal pages drop their empty first row and last column.
+    """
+    blocks = [cols_to_plot[i:i + matrix_size] for i in range(0, len(cols_to_plot), matrix_size)]
+    pages = []
+    for r, row_block in enumerate(blocks):
+        for c, col_block in enumerate(blocks[:r + 1]):
+            if r == c:
+                if len(row_block) > 1:
+                    pages.append((row_block[1:], row_block[:-1]))
+            else:
+                pages.append((row_block, col_block))
+    return pages
+
+def create_scatter_matrix(data, row_cols, col_cols, line_of_best_fit, confidence_interval, cell_size=2.0, pairs=None, density_threshold=None, density_bins=100):
+    """
+    Draws one page of the scatter matrix on a single shared-axes figure with rasterized point layers.
+
+    When pairs is given, only cells whose (col1, col2) pair is in it are drawn. Numeric cells with more than
+    density_threshold rows are drawn as 2D histograms.
+    """
+    order = {col: i for i, col in enumerate(data.columns)}
+    fig, axes = plt.subplots(len(row_cols), len(col_cols), sharex='col', sharey='row', squeeze=False,
+                             figsize=(cell_size * len(col_cols) + 1, cell_size * len(row_cols) + 1))
+    for r, col2 in enumerate(row_cols):
+        for c, col1 in enumerate(col_cols):
+            ax = axes[r, c]
+            if order[col1] >= order[col2] or (pairs is not None and (col1, col2) not in pairs):
+                ax.set_visible(False)
+                continue
+            x, y = data[col1], data[col2]
+            if use_density(x, y, density_threshold):
+                create_density_plot(x, y, ax, density_bins)
+            else:
+                ax.scatter(x, y, s=4, color='C0', linewidths=0, rasterized=True)
+            if line_of_best_fit:
+                fit = fit_line(x, y)
+                if fit is not None:
+                    grid, fitted, lower, upper = fit
+                    ax.plot(grid, fitted, color='C1', linewidth=1)
+                    if confidence_interval:
+                        ax.fill_between(grid, lower, upper, color='C1', alpha=0.2, linewidth=0)
+            if r == len(row_cols) - 1:
+                ax.set_xlabel(col1)
+            if c == 0:
+                ax.set_ylabel(col2)
+    return fig
+
+def save_plot_to_ppt(pipeline, plot, size=Inches(4.5), key=None):
+    # The picture keeps the aspect of the figure (or of the encoded image), with its longer side size long.
+    if isinstance(plot, bytes):
+        with Image.open(BytesIO(plot)) as image:
+            plot_width, plot_height = image.size
+    else:
+        plot_width, plot_height = plot.get_size_inches()
+    scale = size / max(plot_width, plot_height)
+    left = top = Inches(1)
+    pipeline.add(plot, left, top, Emu(round(plot_width * scale)), Emu(round(plot_height * scale)), key=key)
+
+def _init_worker(frame, plot_kwargs, encode_kwargs=None, slide_dpi=None):
+    # Workers never display anything, so render off-screen.
+    plt.switch_backend('Agg')
+    _worker_state['data'] = frame
+    _worker_state['plot_kwargs'] = plot_kwargs
+    _worker_state['encode_kwargs'] = encode_kwargs
+    _worker_state['slide_dpi'] = slide_dpi
+    _worker_state['pool'] = FigurePool()
+
+def create_pair_figure(data, col1, col2, pool=None, **plot_kwargs):
+    fig, ax = plt.subplots() if pool is None else pool.subplots()
+    create_scatter_plot(data[col1], data[col2], ax, **plot_kwargs)
+    set_plot_properties(ax, col1, col2)
+    cached_tight_layout(fig)
+    return fig
+
+def _render_pair_png(pair):
+    col1, col2 = pair
+    pool = _worker_state['pool']
+    fig = create_pair_figure(_worker_state['data'], col1, col2, pool, **_worker_state['plot_kwargs'])
+    encode_kwargs = _worker_state['encode_kwargs']
+    if encode_kwargs is None:
+        return figure_to_png(fig, pool)
+    slide_dpi = _worker_state['slide_dpi']
+    dpi = None if slide_dpi is None else slide_image_dpi(fig, Inches(4.5), slide_dpi)
+    return encode_image(rasterize_figure(fig, pool, dpi), **encode_kwargs)
+
+def render_pairs_parallel(data, column_combinations, n_jobs=None, encode_kwargs=None, slide_dpi=None, **plot_kwargs):
+    """
+    Renders every pair in a process pool and yields PNG bytes in the order of column_combinations.
+
+    At most two pairs per process are submitted ahead of the one being yielded, so a caller that stops early (or
+    closes the generator) only waits for the pairs already being rendered; the rest are cancelled.
+
+    plot_kwargs are passed on to create_scatter_plot in the workers. encode_kwargs, if given, are passed on to
+    report_utils.encode_image instead of saving PNGs with savefig, and slide_dpi then sizes the images to a 4.5 inch
+    slide picture.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    cols = list(dict.fromkeys(col for pair in column_combinations for col in pair))
+    executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                   initargs=(data[cols], plot_kwargs, encode_kwargs, slide_dpi))
+    try:
+        pending = deque()
+        pairs = iter(column_combinations)
+        for pair in islice(pairs, 2 * n_jobs):
+            pending.append(executor.submit(_render_pair_png, pair))
+        while pending:
+            png = pending.popleft().result()
+            for pair in islice(pairs, 1):
+                pending.append(executor.submit(_render_pair_png, pair))
+            yield png
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def select_pairs(data, unique_levels, top_k=None, min_score=None, rank_by='correlation'):
+    """
+    Picks the columns and column pairs to plot.
+
+    Returns (cols_to_plot, column_combinations, ranking). ranking is None unless top_k or min_score is set, in which
+    case column_combinations holds the selected pairs in score order.
+    """
+    cols_to_plot = get_cols_to_plot(data, unique_levels)
+    if top_k is None and min_score is None:
+        return cols_to_plot, list(combinations(cols_to_plot, 2)), None
+
+    ranking = rank_pairs(data, cols_to_plot, rank_by)
+    selected = ranking if min_score is None else ranking[ranking['score'] >= min_score]
+    if top_k is not None:
+        selected = selected.head(top_k)
+    return cols_to_plot, list(zip(selected['col1'], selected['col2'])), ranking
+
+def select_matrix_pages(cols_to_plot, column_combinations, matrix_size, ranked):
+    """Scatter matrix pages covering column_combinations; ranked selections skip columns and pages without a selected pair."""
+    if not ranked:
+        return scatter_matrix_pages(cols_to_plot, matrix_size)
+    selected_pairs = set(column_combinations)
+    cols_to_plot = [col for col in cols_to_plot if any(col in pair for pair in selected_pairs)]
+    return [(row_cols, col_cols) for row_cols, col_cols in scatter_matrix_pages(cols_to_plot, matrix_size)
+            if any((col1, col2) in selected_pairs for col2 in row_cols for col1 in col_cols)]
+
+def _generate_plots(data, column_combinations, ranking, pages, plot_kwargs, as_png, n_jobs, skip=(), encode_kwargs=None, pool=None, slide_dpi=None):
+    # Items whose index is in skip were completed by an earlier run and are not rendered again. encode_kwargs set
+    # the image format (and slide_dpi the resolution) of pairs rendered in the process pool; pair figures rendered
+    # here are taken from pool.
+    scores = {} if ranking is None else dict(zip(zip(ranking['col1'], ranking['col2']), ranking['score']))
+
+    if pages is not None:
+        selected_pairs = None if ranking is None else set(column_combinations)
+        for i, (row_cols, col_cols) in enumerate(pages):
+            if i in skip:
+                continue
+            fig = create_scatter_matrix(data, row_cols, col_cols, plot_kwargs['line_of_best_fit'], plot_kwargs['confidence_interval'],
+                                        pairs=selected_pairs, density_threshold=plot_kwargs['density_threshold'],
+                                        density_bins=plot_kwargs['density_bins'])
+            fig.suptitle(f'Scatter Matrix ({i + 1} of {len(pages)})')
+            cached_tight_layout(fig)
+            yield {'index': i, 'rows': row_cols, 'columns': col_cols}, figure_to_png(fig) if as_png else fig
+        return
+
+    todo = [(i, pair) for i, pair in enumerate(column_combinations) if i not in skip]
+    pairs = [pair for _, pair in todo]
+    if as_png and n_jobs != 1:
+        plots = render_pairs_parallel(data, pairs, n_jobs, encode_kwargs, slide_dpi, **plot_kwargs) if pairs else iter(())
+    else:
+        plots = (create_pair_figure(data, col1, col2, pool, **plot_kwargs) for col1, col2 in pairs)
+        if as_png:
+            plots = (figure_to_png(fig, pool) for fig in plots)
+    for (i, (col1, col2)), plot in zip(todo, plots):
+        metadata = {'index': i, 'x': col1, 'y': col2}
+        if (col1, col2) in scores:
+            metadata['score'] = scores[(col1, col2)]
+        yield metadata, plot
+
+def iter_scatters(data, unique_levels=10, line_of_best_fit=False, confidence_interval=False, bootstrap_ci=False, scatter_matrix=False, matrix_size=5, top_k=None, min_score=None, rank_by='correlation', density_threshold=100000, density_bins=100, as_png=False, n_jobs=1):
+    """
+    Lazily renders the plots all_scatters would make, one pair (or scatter matrix page) per step.
+
+    Takes the same plotting options as all_scatters and yields (metadata, plot) tuples without blocking on input.
+    metadata holds the pair ('x', 'y' and, for ranked selections, 'score') or the page ('rows', 'columns'), and its
+    'index'. plot is a matplotlib Figure, which the caller should close, or PNG bytes when as_png is True. n_jobs
+    renders the pairs in a process pool and only applies with as_png. Raises ValueError for invalid inputs.
+    """
+    validate_inputs(data, unique_levels, 'all', n_jobs, matrix_size, top_k, min_score, rank_by, density_threshold, density_bins)
+    cols_to_plot, column_combinations, ranking = select_pairs(data, unique_levels, top_k, min_score, rank_by)
+    pages = select_matrix_pages(cols_to_plot, column_combinations, matrix_size, ranking is not None) if scatter_matrix else None
+    plot_kwargs = dict(line_of_best_fit=line_of_best_fit, confidence_interval=confidence_interval, bootstrap_ci=bootstrap_ci,
+                       density_threshold=density_threshold, density_bins=density_bins)
+    yield from _generate_plots(data, column_combinations, ranking, pages, plot_kwargs, as_png, n_jobs,
+                               pool=FigurePool() if as_png else None)
+
+def all_scatters(data: pd.core.frame.DataFrame, unique_levels: int = 10, save_to_ppt: bool = False, line_of_best_fit: bool = False, confidence_interval: bool = False, ppt_filename: str = 'output.pptx', plots_at_a_time: int = 'all', n_jobs: int = 1, bootstrap_ci: bool = False, scatter_matrix: bool = False, matrix_size: int = 5, top_k: int = None, min_score: float = None, rank_by: str = 'correlation', density_threshold: int = 100000, density_bins: int = 100, resume: bool = False, checkpoint_dir: str = None, image_format: str = 'png', compress_level: int = 6, jpeg_quality: int = 90, encode_threads: int = None, slide_dpi: float = None, quantize_colors: int = None) -> pd.DataFrame:
+    """
+    Create scatter plots for every combination of two columns with at least `unique_levels` unique values.
+
+    :param data: Input DataFrame
+    :param unique_levels: Minimum number of unique values a column needs to be plotted (default: 10)
+    :param save_to_ppt: Boolean indicating whether to save the plots to a PowerPoint file (default: False)
+    :param line_of_best_fit: Boolean indicating whether to draw a regression line (default: False)
+    :param confidence_interval: Boolean indicating whether to shade the confidence interval of the regression line (default: False)
+    :param ppt_filename: Name of the PowerPoint file to save (if save_to_ppt is True) (default: 'output.pptx')
+    :param plots_at_a_time: Number of plots to show at a time when displaying them, use 'all' to show all plots at once.
+                            Use iter_scatters to page through the plots without blocking on input (default: 'all')
+    :param n_jobs: Number of worker processes rendering slides when save_to_ppt is True, None for every core.
+                   Slides are always added in pair order (default: 1, render in this process)
+    :param bootstrap_ci: Boolean indicating whether to bootstrap the confidence interval with seaborn instead of
+                         computing the analytic t-based band (default: False)
+    :param scatter_matrix: Boolean indicating whether to draw all pairs into shared-axes scatter matrix pages instead of
+                           one figure per pair. plots_at_a_time then counts pages (default: False)
+    :param matrix_size: Maximum number of rows and columns of cells on a scatter matrix page (default: 5)
+    :param top_k: Only plot the top_k best scoring pairs, in score order (default: None, plot every pair)
+    :param min_score: Only plot pairs scoring at least min_score (default: None, no threshold)
+    :param rank_by: Pair score used by top_k and min_score, either 'correlation' (absolute Pearson correlation) or
+                    'mutual_information' (binned mutual information). Pairs with a non-numeric column score 0
+                    (default: 'correlation')
+    :param density_threshold: Numeric pairs with more rows than this are drawn as a 2D histogram with a log color
+                              scale instead of one marker per point, None to always draw points (default: 100000)
+    :param density_bins: Number of bins per axis of the 2D histogram (default: 100)
+    :param resume: Boolean indicating whether to pick up an interrupted save_to_ppt run with the same pairs and
+                   parameters from its checkpoint instead of starting over (default: False)
+    :param checkpoint_dir: Directory in which a 'deck_checkpoint' subdirectory keeps the progress journal and spooled
+                           slide images while saving to PowerPoint; only that subdirectory is removed once the deck is
+                           saved (default: None, '<ppt_filename>.checkpoint')
+    :param image_format: Slide image format, 'png' or 'jpeg' (smaller and faster to encode, but lossy) (default: 'png')
+    :param compress_level: PNG zlib compression level from 0 (fastest, largest) to 9 (slowest, smallest) (default: 6)
+    :param jpeg_quality: JPEG quality from 1 to 95 when image_format is 'jpeg' (default: 90)
+    :param encode_threads: Number of threads encoding slide images while the next plot is drawn. With n_jobs other
+                           than 1 the worker processes encode the pair slides themselves (default: None, up to 4)
+    :param slide_dpi: Pixels per inch of the slide images at their size on the slide, e.g. 150 for sharp but small
+                      decks (default: None, render at the figure's own dpi)
+    :param quantize_colors: Reduce PNG slide images to a palette of this many colors (2-256), which shrinks them
+                            several times over with no visible change for flat-colored plots (default: None)
+    :return: The ranking table of every candidate pair when top_k or min_score is set, otherwise None
+    """
     try:
-        validate_inputs(data, unique_levels, plots_at_a_time)
+        validate_inputs(data, unique_levels, plots_at_a_time, n_jobs, matrix_size, top_k, min_score, rank_by,
+                        density_threshold, density_bins, image_format, slide_dpi, quantize_colors)
     except ValueError as e:
         print(e)
         return
 
-    cols_to_plot = get_cols_to_plot(data, unique_levels)
+    cols_to_plot, column_combinations, ranking = select_pairs(data, unique_levels, top_k, min_score, rank_by)
 
     if not cols_to_plot:
         print("No columns to plot.")
         return
 
-    if save_to_ppt:
-        prs = Presentation()
+    if ranking is not None and not column_combinations:
+        print("No column pairs passed the ranking.")
+        return ranking
 
-    column_combinations = list(combinations(cols_to_plot, 2))
-    num_plots = len(column_combinations)
+    pages = select_matrix_pages(cols_to_plot, column_combinations, matrix_size, ranking is not None) if scatter_matrix else None
+    num_plots = len(pages) if scatter_matrix else len(column_combinations)
     if plots_at_a_time == 'all':
         plots_at_a_time = num_plots
 
-    for i, (col1, col2) in enumerate(column_combinations):
-        x = data[col1]
-        y = data[col2]
-        
-        fig, ax = plt.subplots()
-        
-        create_scatter_plot(x, y, ax, line_of_best_fit, confidence_interval)
-        set_plot_properties(ax, col1, col2)
+    plot_kwargs = dict(line_of_best_fit=line_of_best_fit, confidence_interval=confidence_interval, bootstrap_ci=bootstrap_ci,
+                       density_threshold=density_threshold, density_bins=density_bins)
+
+    completed = set()
+    pool = None
+    if save_to_ppt:
+        run_key = cache_key('all_scatters', column_combinations, pages, data.shape,
+                            *[column_digest(data[col]) for col in cols_to_plot], plot_kwargs, image_format, slide_dpi,
+                            quantize_colors)
+        prs = StreamingDeck(checkpoint_dir=checkpoint_dir or f'{ppt_filename}.checkpoint', run_key=run_key, resume=resume)
+        completed = prs.completed
+        pool = FigurePool()
+        pipeline = EncodingPipeline(prs, encode_threads, image_format, compress_level, jpeg_quality, pool, slide_dpi,
+                                    quantize_colors)
 
+    # Single-process slides (and scatter matrix pages) are encoded by the pipeline's threads; worker processes
+    # encode their own.
+    as_png = save_to_ppt and n_jobs != 1 and not scatter_matrix
+    encode_kwargs = pipeline.encode_kwargs if save_to_ppt else None
+    plots = _generate_plots(data, column_combinations, ranking, pages, plot_kwargs, as_png, n_jobs, completed, encode_kwargs, pool,
+                            slide_dpi)
+    for i, (metadata, plot) in enumerate(plots):
         if save_to_ppt:
-            img_stream = BytesIO()
-            plt.tight_layout()
-            plt.savefig(img_stream, format='png')
-            plt.close()
-            slide_layout = prs.slide_layouts[5]
-            slide = prs.slides.add_slide(slide_layout)
-            left = top = Inches(1)
-            slide.shapes.add_picture(img_stream, left, top, Inches(4.5), Inches(4.5))
-        else:
-            plt.tight_layout()
-            plt.show()
-        
+            save_plot_to_ppt(pipeline, plot, Inches(6) if scatter_matrix else Inches(4.5), metadata['index'])
+            continue
+
+        plt.show()
         if (i+1) % plots_at_a_time == 0 and i < num_plots - 1:
             input("Press Enter to see next set of plots...")
-            
+
     if save_to_ppt:
+        pipeline.close()
         prs.save(ppt_filename)
         print(f'Saved PowerPoint file to: {ppt_filename}')
 
+    return ranking
+
 # Usage example
-np.random.seed(123)
-data = {
-    'var1': np.random.choice(list(range(10)), 100),  # < 10 unique levels
-    'var2': np.random.choice(list(range(10)), 100),  # < 10 unique levels
-    'var3': np.random.choice(list(range(10)), 100),  # < 10 unique levels
-    'var4': np.random.choice(list(range(20)), 100),  # 10-20 unique levels
-    'var5': np.random.choice(list(range(20)), 100),  # 10-20 unique levels
-    'var6': np.random.choice(list(range(20)), 100),  # 10-20 unique levels
-    'var7': np.random.choice(list(range(200)), 100), # > 100 unique levels
-    'var8': np.random.choice(list(range(200)), 100), # > 100 unique levels
-    'var9': np.random.choice(list(range(200)), 100), # > 100 unique levels
-    'var10': np.random.choice(list(range(200)), 100) # > 100 unique levels
-}
-df = pd.DataFrame(data)
-all_scatters(df, unique_levels=15, save_to_ppt=False, line_of_best_fit=True, confidence_interval=True, plots_at_a_time=4)
+if __name__ == '__main__':
+    np.random.seed(123)
+    data = {
+        'var1': np.random.choice(list(range(10)), 100),  # < 10 unique levels
+        'var2': np.random.choice(list(range(10)), 100),  # < 10 unique levels
+        'var3': np.random.choice(list(range(10)), 100),  # < 10 unique levels
+        'var4': np.random.choice(list(range(20)), 100),  # 10-20 unique levels
+        'var5': np.random.choice(list(range(20)), 100),  # 10-20 unique levels
+        'var6': np.random.choice(list(range(20)), 100),  # 10-20 unique levels
+        'var7': np.random.choice(list(range(200)), 100), # > 100 unique levels
+        'var8': np.random.choice(list(range(200)), 100), # > 100 unique levels
+        'var9': np.random.choice(list(range(200)), 100), # > 100 unique levels
+        'var10': np.random.choice(list(range(200)), 100) # > 100 unique levels
+    }
+    df = pd.DataFrame(data)
+    all_scatters(df, unique_levels=15, save_to_ppt=False, line_of_best_fit=True, confidence_interval=True, plots_at_a_time=4)
@@ -1,12 +1,496 @@
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
 import pandas as pd
 import numpy as np
+from PIL import Image
 from matplotlib import pyplot as plt
 from matplotlib.animation import FuncAnimation
+from matplotlib.lines import Line2D
 from IPython.display import HTML, display
-from adjustText import adjust_text
 import ipywidgets as widgets
 
-def animated_bubble(df, time_col, x_col, y_col, size_col, color_col, label_col, interval='day', bubble_scale=5000):
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Frame file format spooled for each export file extension.
+EXPORT_FORMATS = {'.gif': 'gif', '.png': 'png', '.apng': 'png', '.html': 'png'}
+
+# Per-process state for the parallel frame export, populated by _init_worker.
+_worker_state = {}
+
+def index_frames(df, time_col, color_col, frame_times, colors):
+    """
+    Sorts the rows of df once by (frame, color) so each frame and color group is a contiguous slice.
+
+    Rows whose time is not in frame_times or whose color is missing are left out. Returns (order, starts, ends):
+    the rows of frame f with colors[c] are order[starts[f, c]:ends[f, c]], in their original order.
+    """
+    frame_codes = pd.DatetimeIndex(frame_times).get_indexer(pd.to_datetime(df[time_col]))
+    color_codes = pd.Index(colors).get_indexer(df[color_col])
+    keep = np.flatnonzero((frame_codes >= 0) & (color_codes >= 0) & df[color_col].notna().to_numpy())
+    keys = frame_codes[keep].astype(np.int64) * len(colors) + color_codes[keep]
+    sort = np.argsort(keys, kind='stable')
+    order, keys = keep[sort], keys[sort]
+    groups = np.arange(len(frame_times) * len(colors))
+    starts = np.searchsorted(keys, groups, side='left').reshape(len(frame_times), len(colors))
+    ends = np.searchsorted(keys, groups, side='right').reshape(len(frame_times), len(colors))
+    return order, starts, ends
+
+class LabelPlacer:
+    """
+    Moves labels apart until their boxes stop overlapping, warm-started from where each label ended up last time.
+
+    Works in display coordinates. A label's home is just left of and above its anchor point (where a right-aligned
+    label sits). Each call first eases every label a fraction pull of the way from its previous offset back towards
+    home, then repeatedly pushes overlapping pairs apart along the axis of least (relative) overlap. Candidate pairs
+    come from a spatial hash grid with cells as large as the biggest label, so each label is only checked against
+    labels in the neighboring cells. Labels that kept their place since the last frame start out solved, so sparse
+    frames need fewer iterations (crowded ones can still use all max_iter), and labels glide between frames instead
+    of jumping.
+    """
+
+    def __init__(self, max_iter=50, pull=0.2, padding=2):
+        self.max_iter = max_iter
+        self.pull = pull
+        self.padding = padding
+        self.offsets = {}
+        self.iterations = 0
+
+    def place(self, keys, anchors, sizes, bounds):
+        """
+        Returns the display coordinates of the label centers.
+
+        keys identify the labels across frames, anchors are the points they label and sizes their (width, height),
+        all in display units. bounds is (x0, y0, x1, y1), the box the labels are kept inside.
+        """
+        n = len(keys)
+        if n == 0:
+            return np.empty((0, 2))
+        half = sizes / 2 + self.padding
+        home = anchors + np.column_stack([-sizes[:, 0] / 2, sizes[:, 1] / 2])
+        previous = np.array([self.offsets.get(key, (0.0, 0.0)) for key in keys], dtype=float)
+        centers = home + (1 - self.pull) * previous
+        low, high = np.array(bounds[:2]) + half, np.array(bounds[2:]) - half
+        cell = 2 * half.max()
+
+        for self.iterations in range(self.max_iter):
+            centers = np.minimum(np.maximum(centers, low), high)
+            cx, cy = centers[:, 0].tolist(), centers[:, 1].tolist()
+            hx, hy = half[:, 0].tolist(), half[:, 1].tolist()
+            grid = defaultdict(list)
+            cells = [(int(x // cell), int(y // cell)) for x, y in zip(cx, cy)]
+            for i, key in enumerate(cells):
+                grid[key].append(i)
+
+            moved = False
+            for i, (gx, gy) in enumerate(cells):
+                for neighbor in ((gx + a, gy + b) for a in (-1, 0, 1) for b in (-1, 0, 1)):
+                    for j in grid.get(neighbor, ()):
+                        if j <= i:
+                            continue
+                        dx, dy = cx[j] - cx[i], cy[j] - cy[i]
+                        reach_x, reach_y = hx[i] + hx[j], hy[i] + hy[j]
+                        overlap_x, overlap_y = reach_x - abs(dx), reach_y - abs(dy)
+                        if overlap_x <= 0 or overlap_y <= 0:
+                            continue
+                        # Push both labels half the overlap apart (plus a little, so they do not keep touching)
+                        # and let later pairs in this sweep see the new positions. Overlaps are compared relative
+                        # to the label sizes, otherwise wide labels keep sliding sideways into their neighbors.
+                        if overlap_x / reach_x < overlap_y / reach_y:
+                            shift = (overlap_x / 2 + 1) * (1 if dx >= 0 else -1)
+                            cx[i] -= shift
+                            cx[j] += shift
+                        else:
+                            shift = (overlap_y / 2 + 1) * (1 if dy >= 0 else -1)
+                            cy[i] -= shift
+                            cy[j] += shift
+                        moved = True
+            centers = np.column_stack([cx, cy])
+            if not moved:
+                break
+        centers = np.minimum(np.maximum(centers, low), high)
+
+        for key, offset in zip(keys, centers - home):
+            self.offsets[key] = offset
+        return centers
+
+
+class BubbleRenderer:
+    """
+    Draws animated_bubble frames on persistent artists.
+
+    One PathCollection per color group, the legend, the axis labels and limits are created once; drawing a frame
+    only replaces the offsets and sizes of the collections and moves a pool of label Text artists, growing the pool
+    when a frame has more labels than any frame before it. The axes limits are fixed to the extent of all frames so
+    the artists can be blitted. Labels are spread out by a LabelPlacer that carries over from frame to frame, and
+    their sizes are measured once per distinct label.
+    """
+
+    def __init__(self, df, time_col, x_col, y_col, size_col, color_col, label_col, frame_times, bubble_scale=5000):
+        self.frame_times = frame_times
+        self.bubble_scale = bubble_scale
+        self.colors = df[color_col].unique()
+
+        # Sort once so every frame only touches its own rows instead of masking the whole frame per frame and color.
+        order, self.starts, self.ends = index_frames(df, time_col, color_col, frame_times, self.colors)
+        self.xs = df[x_col].to_numpy()[order]
+        self.ys = df[y_col].to_numpy()[order]
+        self.bubble_sizes = df[size_col].to_numpy(dtype=float)[order]
+        self.labels = df[label_col].to_numpy()[order]
+
+        self.fig, self.ax = plt.subplots()
+        ax = self.ax
+        self.collections = [ax.scatter(np.empty(0), np.empty(0), s=np.empty(0),
+                                       color=plt.cm.viridis(c / len(self.colors)), label=color_value,
+                                       alpha=0.6, edgecolors='w')
+                            for c, color_value in enumerate(self.colors)]
+        self.texts = []
+        self.label_placer = LabelPlacer()
+        self._label_sizes = {}
+        points = np.column_stack([self.xs, self.ys]).astype(float)
+        ax.update_datalim(points[np.isfinite(points).all(axis=1)])
+        ax.autoscale_view()
+        ax.set_xlabel(x_col.capitalize())
+        ax.set_ylabel(y_col.capitalize())
+        # The time stamp sits inside the axes: blitting only redraws the axes area, which excludes the title.
+        self.time_text = ax.text(0.02, 0.98, '', transform=ax.transAxes, ha='left', va='top', fontsize=12)
+        # The collections start out empty, so the legend gets marker stand-ins of its own.
+        handles = [Line2D([], [], linestyle='', marker='o', markersize=10, color=collection.get_facecolor()[0],
+                          markeredgecolor='w', label=collection.get_label()) for collection in self.collections]
+        ax.legend(handles=handles, title=color_col, bbox_to_anchor=(1.05, 1), loc='upper left')
+
+    def __len__(self):
+        return len(self.frame_times)
+
+    def _label(self, i):
+        while len(self.texts) <= i:
+            self.texts.append(self.ax.text(0, 0, '', fontsize=9, ha='center', va='center'))
+        return self.texts[i]
+
+    def draw_frame(self, frame):
+        """Updates the artists to show frame and returns the artists that changed."""
+        for c, collection in enumerate(self.collections):
+            rows = slice(self.starts[frame, c], self.ends[frame, c])
+            group_sizes = self.bubble_sizes[rows]
+            sizes = self.bubble_scale * (group_sizes / np.nanmax(group_sizes)) if len(group_sizes) else group_sizes
+            collection.set_offsets(np.column_stack([self.xs[rows], self.ys[rows]]))
+            collection.set_sizes(sizes)
+
+        # The color groups of a frame are adjacent, so the frame's labels are one slice.
+        rows = slice(self.starts[frame, 0], self.ends[frame, -1]) if len(self.colors) else slice(0, 0)
+        keys = [str(label) for label in self.labels[rows]]
+        for i, key in enumerate(keys):
+            text = self._label(i)
+            text.set_text(key)
+            text.set_visible(True)
+            if key not in self._label_sizes:
+                # No explicit renderer: the callers close the figure, which leaves it a canvas without one.
+                extent = text.get_window_extent()
+                self._label_sizes[key] = (extent.width, extent.height)
+        for text in self.texts[len(keys):]:
+            text.set_visible(False)
+
+        if keys:
+            anchors = self.ax.transData.transform(np.column_stack([self.xs[rows], self.ys[rows]]).astype(float))
+            placed = np.flatnonzero(np.isfinite(anchors).all(axis=1))
+            sizes = np.array([self._label_sizes[keys[i]] for i in placed]).reshape(-1, 2)
+            centers = self.label_placer.place([keys[i] for i in placed], anchors[placed], sizes, self.ax.bbox.extents)
+            for text in self.texts[:len(keys)]:
+                text.set_visible(False)
+            for i, position in zip(placed, self.ax.transData.inverted().transform(centers)):
+                self.texts[i].set_position(position)
+                self.texts[i].set_visible(True)
+        self.time_text.set_text(f'Time: {self.frame_times[frame].strftime("%Y-%m-%d")}')
+        return [*self.collections, *self.texts, self.time_text]
+
+
+class LazyBubblePlayer:
+    """
+    Notebook player that renders animated_bubble frames only when they are requested.
+
+    The widget shows one frame at a time, picked with a play button and slider. Rendered frames are kept as PNG bytes
+    in an LRU cache of cache_frames frames, and after each requested frame the next prefetch frames are rendered on
+    a background thread, so playing forward rarely waits for a render. A lock serializes all drawing on the shared
+    renderer.
+    """
+
+    def __init__(self, renderer, cache_frames=64, prefetch=3, frame_duration=200):
+        self.renderer = renderer
+        self.cache_frames = cache_frames
+        self.prefetch = prefetch
+        self.frame_duration = frame_duration
+        self._cache = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def frame_png(self, frame):
+        """Returns frame as PNG bytes, rendering it unless it is cached."""
+        with self._lock:
+            if frame in self._cache:
+                self._cache.move_to_end(frame)
+                return self._cache[frame]
+            self.renderer.draw_frame(frame)
+            img_stream = BytesIO()
+            self.renderer.fig.savefig(img_stream, format='png')
+            self._cache[frame] = img_stream.getvalue()
+            while len(self._cache) > self.cache_frames:
+                self._cache.popitem(last=False)
+            return self._cache[frame]
+
+    def _prefetch_frame(self, frame):
+        try:
+            self.frame_png(frame)
+        finally:
+            self._pending.discard(frame)
+
+    def prefetch_after(self, frame):
+        """Queues the frames following frame that are neither cached nor queued for background rendering."""
+        for next_frame in range(frame + 1, min(frame + 1 + self.prefetch, len(self.renderer))):
+            if next_frame not in self._cache and next_frame not in self._pending:
+                self._pending.add(next_frame)
+                self._executor.submit(self._prefetch_frame, next_frame)
+
+    def widget(self):
+        """Builds the player widget, showing the first frame."""
+        last_frame = len(self.renderer) - 1
+        play = widgets.Play(min=0, max=last_frame, interval=self.frame_duration)
+        slider = widgets.IntSlider(min=0, max=last_frame, description='Frame:')
+        widgets.jslink((play, 'value'), (slider, 'value'))
+        image = widgets.Image(value=self.frame_png(0), format='png')
+
+        def show(change):
+            image.value = self.frame_png(change['new'])
+            self.prefetch_after(change['new'])
+
+        slider.observe(show, names='value')
+        self.prefetch_after(0)
+        return widgets.VBox([image, widgets.HBox([play, slider])])
+
+def _render_range(renderer, start, stop, spool_dir, frame_format, label_offsets=None):
+    """
+    Draws frames start to stop - 1 with renderer and writes them to spool_dir as frame%06d.png or .gif files.
+
+    label_offsets, if given, replaces the label placer state the first frame starts from.
+    """
+    if label_offsets is not None:
+        renderer.label_placer.offsets = dict(label_offsets)
+    for frame in range(start, stop):
+        renderer.draw_frame(frame)
+        path = os.path.join(spool_dir, f'frame{frame:06d}.{frame_format}')
+        if frame_format == 'gif':
+            img_stream = BytesIO()
+            renderer.fig.savefig(img_stream, format='png')
+            Image.open(img_stream).convert('RGB').quantize(colors=256).save(path, format='GIF')
+        else:
+            renderer.fig.savefig(path, format='png')
+    return stop - start
+
+def _init_worker(renderer_args):
+    # Workers never display anything, so render off-screen.
+    plt.switch_backend('Agg')
+    _worker_state['renderer'] = BubbleRenderer(*renderer_args)
+
+def _render_frames(task):
+    return _render_range(_worker_state['renderer'], *task)
+
+def _chunk_label_offsets(renderer, starts, n_frames):
+    """
+    Places the labels of every frame in order, without rendering, and returns the label placer state at each of the
+    frame indices in starts.
+    """
+    starts = set(starts)
+    offsets = {}
+    for frame in range(n_frames):
+        if frame in starts:
+            offsets[frame] = dict(renderer.label_placer.offsets)
+        renderer.draw_frame(frame)
+    return offsets
+
+def _png_chunks(data):
+    """Yields (type, data) for every chunk of the PNG file contents in data."""
+    pos = len(PNG_SIGNATURE)
+    while pos < len(data):
+        length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+        yield chunk_type, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+def _png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+def write_apng(frame_paths, path, frame_duration=200):
+    """
+    Assembles equally sized PNG frames into an animated PNG, copying each frame's compressed image data so only one
+    frame is held in memory at a time.
+    """
+    with open(path, 'wb') as out:
+        out.write(PNG_SIGNATURE)
+        sequence = 0
+        for i, frame_path in enumerate(frame_paths):
+            with open(frame_path, 'rb') as f:
+                chunks = list(_png_chunks(f.read()))
+            header = chunks[0][1]
+            if i == 0:
+                first_header = header
+                out.write(_png_chunk(b'IHDR', header))
+                out.write(_png_chunk(b'acTL', struct.pack('>II', len(frame_paths), 0)))
+            elif header != first_header:
+                raise ValueError(f'{frame_path} does not match the size and color type of the first frame.')
+            width, height = struct.unpack('>II', header[:8])
+            out.write(_png_chunk(b'fcTL', struct.pack('>IIIIIHHBB', sequence, width, height, 0, 0,
+                                                      frame_duration, 1000, 0, 0)))
+            sequence += 1
+            for chunk_type, data in chunks:
+                if chunk_type != b'IDAT':
+                    continue
+                if i == 0:
+                    out.write(_png_chunk(b'IDAT', data))
+                else:
+                    out.write(_png_chunk(b'fdAT', struct.pack('>I', sequence) + data))
+                    sequence += 1
+        out.write(_png_chunk(b'IEND', b''))
+
+def _skip_gif_blocks(data, pos):
+    """Returns the position after the data sub-blocks starting at pos."""
+    while data[pos]:
+        pos += data[pos] + 1
+    return pos + 1
+
+def write_gif(frame_paths, path, frame_duration=200):
+    """
+    Assembles equally sized single-image GIF frames into a looping animated GIF. Each frame keeps its own palette as
+    a local color table, and frames are copied one at a time so memory does not grow with the number of frames.
+    """
+    with open(path, 'wb') as out:
+        for i, frame_path in enumerate(frame_paths):
+            with open(frame_path, 'rb') as f:
+                data = f.read()
+            width, height, flags = struct.unpack('<HHB', data[6:11])
+            pos = 13
+            color_table = b''
+            if flags & 0x80:
+                color_table = data[pos:pos + 3 * 2 ** ((flags & 7) + 1)]
+                pos += len(color_table)
+            while data[pos] == 0x21:
+                pos = _skip_gif_blocks(data, pos + 2)
+            descriptor = bytearray(data[pos:pos + 10])
+            pos += 10
+            if not descriptor[9] & 0x80:
+                # Move the global color table into the image as a local one.
+                descriptor[9] = (descriptor[9] & 0x78) | 0x80 | (flags & 7)
+                descriptor += color_table
+            image_end = _skip_gif_blocks(data, pos + 1)
+
+            if i == 0:
+                out.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0x70, 0, 0))
+                out.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', 0) + b'\x00')
+            out.write(b'\x21\xf9\x04\x00' + struct.pack('<H', round(frame_duration / 10)) + b'\x00\x00')
+            out.write(bytes(descriptor) + data[pos:image_end])
+        out.write(b'\x3b')
+
+def write_html_player(frame_paths, path, frame_duration=200):
+    """
+    Moves the frames into a '<name>_frames' directory next to path and writes a player page that loads them on
+    demand, a few frames ahead of the one shown, instead of embedding every frame in the page.
+    """
+    frame_dir = f'{os.path.splitext(path)[0]}_frames'
+    if os.path.isdir(frame_dir):
+        shutil.rmtree(frame_dir)
+    os.makedirs(frame_dir)
+    for frame_path in frame_paths:
+        shutil.move(frame_path, os.path.join(frame_dir, os.path.basename(frame_path)))
+    template = """<!DOCTYPE html>
+<html>
+<body>
+<img id="frame">
+<div>
+  <button id="play">Play</button>
+  <input id="slider" type="range" min="0" max="{last}" value="0">
+</div>
+<script>
+const lastFrame = {last}, frameDir = "{frame_dir}", frameDuration = {frame_duration};
+const img = document.getElementById("frame"), slider = document.getElementById("slider"), play = document.getElementById("play");
+let preloaded = {{}}, timer = null;
+function frameSrc(i) {{ return frameDir + "/frame" + String(i).padStart(6, "0") + ".png"; }}
+function show(i) {{
+  img.src = frameSrc(i);
+  slider.value = i;
+  const ahead = {{}};
+  for (let j = i + 1; j <= Math.min(i + 10, lastFrame); j++) {{
+    ahead[j] = preloaded[j] || new Image();
+    ahead[j].src = frameSrc(j);
+  }}
+  preloaded = ahead;
+}}
+slider.oninput = () => show(Number(slider.value));
+play.onclick = () => {{
+  if (timer) {{ clearInterval(timer); timer = null; play.textContent = "Play"; return; }}
+  timer = setInterval(() => show((Number(slider.value) + 1) % (lastFrame + 1)), frameDuration);
+  play.textContent = "Pause";
+}};
+show(0);
+</script>
+</body>
+</html>
+"""
+    with open(path, 'w') as f:
+        f.write(template.format(last=len(frame_paths) - 1, frame_dir=os.path.basename(frame_dir),
+                                frame_duration=frame_duration))
+
+def export_frames(renderer_args, n_frames, output_path, n_jobs=1, frame_duration=200, progress=None):
+    """
+    Renders n_frames frames of BubbleRenderer(*renderer_args) to output_path, an animated GIF ('.gif'), animated
+    PNG ('.png' or '.apng') or an HTML player ('.html') loading the frames from a sibling directory.
+
+    Frames are split into contiguous chunks rendered by n_jobs processes (None for every core), each with its own
+    renderer, and written to a spool directory as they complete; the output is then assembled from the spooled
+    files one frame at a time, so memory stays bounded however many frames there are. Label positions carry over
+    from frame to frame, so before rendering in parallel the labels of all frames are placed once in order (a few
+    percent of the rendering time) and every chunk starts from the placement a sequential export would have reached.
+    progress, if given, is a widget whose value counts the rendered frames.
+    """
+    extension = os.path.splitext(output_path)[1].lower()
+    frame_format = EXPORT_FORMATS[extension]
+    n_jobs = n_jobs or os.cpu_count() or 1
+    chunk_size = max(1, -(-n_frames // (n_jobs * 4)))
+    spool_dir = tempfile.mkdtemp(prefix='frames_')
+    tasks = [(start, min(start + chunk_size, n_frames), spool_dir, frame_format)
+             for start in range(0, n_frames, chunk_size)]
+    try:
+        renderer = BubbleRenderer(*renderer_args)
+        plt.close(renderer.fig)
+        if n_jobs == 1:
+            for task in tasks:
+                count = _render_range(renderer, *task)
+                if progress is not None:
+                    progress.value += count
+        else:
+            label_offsets = _chunk_label_offsets(renderer, [task[0] for task in tasks], n_frames)
+            tasks = [(*task, label_offsets[task[0]]) for task in tasks]
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(renderer_args,)) as executor:
+                for count in executor.map(_render_frames, tasks):
+                    if progress is not None:
+                        progress.value += count
+
+        frame_paths = [os.path.join(spool_dir, f'frame{frame:06d}.{frame_format}') for frame in range(n_frames)]
+        if extension == '.gif':
+            write_gif(frame_paths, output_path, frame_duration)
+        elif extension == '.html':
+            write_html_player(frame_paths, output_path, frame_duration)
+        else:
+            write_apng(frame_paths, output_path, frame_duration)
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    return output_path
+
+def animated_bubble(df, time_col, x_col, y_col, size_col, color_col, label_col, interval='day', bubble_scale=5000,
+                    output_path=None, n_jobs=1, frame_duration=200, lazy=False, cache_frames=64, prefetch=3):
     """
     Generates an animated bubble plot.
 
@@ -20,10 +504,23 @@ def animated_bubble(df, time_col, x_col, y_col, size_col, color_col, label_col,
     label_col (str): The column name representing the labels of the bubbles.
     interval (str): The time interval for animation (day, week, month, quarter, year). Default is 'day'.
     bubble_scale (int): The scaling factor for the bubble sizes. Default is 5000.
+    output_path (str): If given, export the animation to this file instead of building it in memory: an animated GIF
+                       ('.gif'), animated PNG ('.png' or '.apng') or an HTML player ('.html') that loads the frames
+                       from a '<name>_frames' directory next to it. Default is None.
+    n_jobs (int): Number of processes rendering frames for output_path, None for every core. Default is 1.
+    frame_duration (int): Milliseconds each frame is shown for in the exported animation or lazy player. Default
+                          is 200.
+    lazy (bool): Return a notebook player widget that renders each frame when it is first shown instead of
+                 rendering every frame up front. Default is False.
+    cache_frames (int): Number of rendered frames the lazy player keeps. Default is 64.
+    prefetch (int): Number of frames the lazy player renders ahead in the background. Default is 3.
 
     Returns:
-    HTML object: An HTML object containing the animated bubble plot.
+    HTML object: An HTML object containing the animated bubble plot, output_path when exporting, or the player
+                 widget when lazy is True.
     """
+    if output_path is not None and os.path.splitext(output_path)[1].lower() not in EXPORT_FORMATS:
+        raise ValueError(f"output_path should end in one of {', '.join(EXPORT_FORMATS)}.")
     
     time_intervals = {
         'day': 'D',
@@ -34,70 +531,59 @@ def animated_bubble(df, time_col, x_col, y_col, size_col, color_col, label_col,
     }
     
     unique_dates = pd.date_range(start=df[time_col].min(), end=df[time_col].max(), freq=time_intervals[interval])
-    unique_colors = df[color_col].unique()
-    color_map = {color: idx for idx, color in enumerate(unique_colors)}
-    
-    fig, ax = plt.subplots()
+
+    if lazy:
+        renderer = BubbleRenderer(df, time_col, x_col, y_col, size_col, color_col, label_col, unique_dates, bubble_scale)
+        plt.close(renderer.fig)
+        return LazyBubblePlayer(renderer, cache_frames, prefetch, frame_duration).widget()
     
     progress = widgets.FloatProgress(value=0, min=0, max=len(unique_dates), description='Loading:', bar_style='info')
     display(progress)
+
+    if output_path is not None:
+        columns = list(dict.fromkeys([time_col, x_col, y_col, size_col, color_col, label_col]))
+        renderer_args = (df[columns], time_col, x_col, y_col, size_col, color_col, label_col, unique_dates, bubble_scale)
+        return export_frames(renderer_args, len(unique_dates), output_path, n_jobs, frame_duration, progress)
+
+    renderer = BubbleRenderer(df, time_col, x_col, y_col, size_col, color_col, label_col, unique_dates, bubble_scale)
     
     def update(frame):
-        ax.clear()
-        current_time = unique_dates[frame]
-        mask = df[time_col] == current_time
-        current_data = df[mask]
-        
-        texts = []
-        for color_value in unique_colors:
-            color_data = current_data[current_data[color_col] == color_value]
-            sizes = bubble_scale * (color_data[size_col] / color_data[size_col].max())  
-            scatter = ax.scatter(color_data[x_col], color_data[y_col], s=sizes, 
-                                 color=plt.cm.viridis(color_map[color_value] / len(unique_colors)), label=color_value, 
-                                 alpha=0.6, edgecolors='w')
-
-            for i in range(len(color_data)):
-                texts.append(ax.text(color_data[x_col].iloc[i], color_data[y_col].iloc[i], color_data[label_col].iloc[i], fontsize=9, ha='right'))
-        
-        adjust_text(texts)
-        ax.set_xlabel(x_col.capitalize())
-        ax.set_ylabel(y_col.capitalize())
-        ax.set_title(f'Time: {current_time.strftime("%Y-%m-%d")}', fontsize=12)
-        ax.legend(title=color_col, bbox_to_anchor=(1.05, 1), loc='upper left')
-        
+        artists = renderer.draw_frame(frame)
         progress.value += 1
+        return artists
 
-    ani = FuncAnimation(fig, update, frames=len(unique_dates), repeat=False)
+    ani = FuncAnimation(renderer.fig, update, frames=len(unique_dates), repeat=False, blit=True)
     
-    plt.close(fig)
+    plt.close(renderer.fig)
     return HTML(ani.to_jshtml())
 
 # Example usage
-dates = pd.date_range(start='1/1/2020', periods=100, freq='D')
-companies = [f'Company {i}' for i in range(15)]
-industries = ['Industry1', 'Industry2', 'Industry3']
-
-data = {
-    'time': [],
-    'Marketing Spend': [],
-    'Sales': [],
-    'Marketing Efficiency': [],
-    'Industry': [],
-    'Company': []
-}
-
-for date in dates:
-    for company in companies:
-        industry = np.random.choice(industries)
-        marketing_spend = np.random.rand() * 1000
-        sales = np.random.rand() * 10000
-        efficiency = marketing_spend / sales
-        data['time'].append(date)
-        data['Marketing Spend'].append(marketing_spend)
-        data['Sales'].append(sales)
-        data['Marketing Efficiency'].append(efficiency)
-        data['Industry'].append(industry)
-        data['Company'].append(company)
-
-df = pd.DataFrame(data)
-animated_bubble(df, time_col='time', x_col='Marketing Spend', y_col='Sales', size_col='Marketing Efficiency', color_col='Industry', label_col='Company', interval='day')
+if __name__ == '__main__':
+    dates = pd.date_range(start='1/1/2020', periods=100, freq='D')
+    companies = [f'Company {i}' for i in range(15)]
+    industries = ['Industry1', 'Industry2', 'Industry3']
+
+    data = {
+        'time': [],
+        'Marketing Spend': [],
+        'Sales': [],
+        'Marketing Efficiency': [],
+        'Industry': [],
+        'Company': []
+    }
+
+    for date in dates:
+        for company in companies:
+            industry = np.random.choice(industries)
+            marketing_spend = np.random.rand() * 1000
+            sales = np.random.rand() * 10000
+            efficiency = marketing_spend / sales
+            data['time'].append(date)
+            data['Marketing Spend'].append(marketing_spend)
+            data['Sales'].append(sales)
+            data['Marketing Efficiency'].append(efficiency)
+            data['Industry'].append(industry)
+            data['Company'].append(company)
+
+    df = pd.DataFrame(data)
+    animated_bubble(df, time_col='time', x_col='Marketing Spend', y_col='Sales', size_col='Marketing Efficiency', color_col='Industry', label_col='Company', interval='day')
@@ -1,9 +1,677 @@
+import hashlib
+import json
+import os
+import time
+
 import networkx as nx
+import numpy as np
 import plotly.graph_objects as go
 import pandas as pd
+import scipy.sparse as sp
 from community import community_louvain
 
-def network_map(data, source_col, target_col, edge_weight_col=None, node_size_col=None, node_color_col=None, colorscale='Viridis', interactive=False, community_detection=False):
+
+def _best_neighbors(n, source, target, score):
+    """Returns, for every node, the target of its highest scoring edge among the given ones (-1 without edges)."""
+    best = np.full(n, -1, dtype=np.intp)
+    if len(source) == 0:
+        return best
+    order = np.lexsort((score, source))
+    last = np.r_[source[order][1:] != source[order][:-1], True]
+    best[source[order][last]] = target[order][last]
+    return best
+
+
+def _coarsen(n, source, target, weight, mass, rng, rounds=10):
+    """
+    Collapses a matching of the graph into single nodes.
+
+    Every unmatched node proposes to the unmatched neighbor with the heaviest edge relative to the two node masses
+    (so light nodes are merged first and the coarse nodes stay balanced), and mutual proposals are matched, for up
+    to rounds rounds. Nodes left unmatched then join the coarse node of their best neighbor, so stars and other
+    hubs collapse too. Returns the parent of every node, the coarse node count and the coarse edges and masses,
+    where parallel coarse edges are merged by summing their weights.
+    """
+    parent = np.full(n, -1, dtype=np.intp)
+    both_source = np.concatenate([source, target])
+    both_target = np.concatenate([target, source])
+    both_score = np.tile(weight, 2) / (mass[both_source] * mass[both_target])
+    both_score = both_score * (1 + 1e-6 * rng.random(len(both_score)))
+    n_coarse = 0
+    for _ in range(rounds):
+        free = (parent[both_source] < 0) & (parent[both_target] < 0)
+        if not free.any():
+            break
+        proposal = _best_neighbors(n, both_source[free], both_target[free], both_score[free])
+        nodes = np.flatnonzero(proposal >= 0)
+        mutual = nodes[(proposal[proposal[nodes]] == nodes) & (nodes < proposal[nodes])]
+        parent[mutual] = parent[proposal[mutual]] = n_coarse + np.arange(len(mutual))
+        n_coarse += len(mutual)
+    left = (parent[both_source] < 0) & (parent[both_target] >= 0)
+    best = _best_neighbors(n, both_source[left], both_target[left], both_score[left])
+    joining = np.flatnonzero(best >= 0)
+    parent[joining] = parent[best[joining]]
+    singles = np.flatnonzero(parent < 0)
+    parent[singles] = n_coarse + np.arange(len(singles))
+    n_coarse += len(singles)
+
+    coarse_source, coarse_target = parent[source], parent[target]
+    keep = coarse_source != coarse_target
+    low = np.minimum(coarse_source[keep], coarse_target[keep])
+    high = np.maximum(coarse_source[keep], coarse_target[keep])
+    pairs, inverse = np.unique(low * n_coarse + high, return_inverse=True)
+    coarse_weight = np.bincount(inverse, weights=weight[keep], minlength=len(pairs))
+    coarse_mass = np.bincount(parent, weights=mass, minlength=n_coarse)
+    return parent, n_coarse, pairs // n_coarse, pairs % n_coarse, coarse_weight, coarse_mass
+
+
+def _interaction_offsets():
+    """
+    Cell offsets a node interacts with at one quadtree depth, by the parity of its cell.
+
+    These are the children of the cells adjacent to the parent cell (a 6 x 6 block) minus the cells adjacent to the
+    node's own cell, 27 offsets for each of the four parities.
+    """
+    table = np.empty((2, 2, 27, 2), dtype=np.intp)
+    for parity_x in (0, 1):
+        for parity_y in (0, 1):
+            table[parity_x, parity_y] = [(ox, oy) for ox in range(-2 - parity_x, 4 - parity_x)
+                                         for oy in range(-2 - parity_y, 4 - parity_y) if max(abs(ox), abs(oy)) > 1]
+    return table
+
+
+INTERACTION_OFFSETS = _interaction_offsets()
+NEIGHBOR_OFFSETS = np.array([(ox, oy) for ox in (-1, 0, 1) for oy in (-1, 0, 1) if ox or oy], dtype=np.intp)
+
+
+def _repulsion(pos, mass, depth, nodes=None):
+    """
+    Barnes-Hut approximation of the repulsive forces (mass / distance, pushing nodes apart) on the given nodes (all
+    nodes if None), exerted by every node.
+
+    The quadtree is kept as one grid per depth, the cells of depth d being the quadrants of the cells of depth d - 1,
+    with the mass and center of mass of every cell. A node is pushed by the cells of each depth that are not adjacent
+    to its own cell but whose parents are adjacent to its parent (so the cells of all depths together cover every
+    other node exactly once, each cell being at least its own width away from the node), and at the deepest depth by
+    the adjacent cells and the rest of its own cell.
+    """
+    if nodes is None:
+        nodes = slice(None)
+    node_pos, node_mass = pos[nodes], mass[nodes]
+    force = np.zeros_like(node_pos)
+    low = pos.min(axis=0)
+    span = max(float((pos.max(axis=0) - low).max()), 1e-9) * (1 + 1e-9)
+    x, y = node_pos[:, 0, None], node_pos[:, 1, None]
+
+    def push(cell_mass, center_x, center_y):
+        # cell_mass and the centers are (nodes, cells) arrays; empty cells have zero mass.
+        dx, dy = x - center_x, y - center_y
+        scale = cell_mass / np.maximum(dx * dx + dy * dy, 1e-4)
+        force[:, 0] += np.einsum('ij,ij->i', dx, scale)
+        force[:, 1] += np.einsum('ij,ij->i', dy, scale)
+
+    for level in range(2, depth + 1):
+        size = 2 ** level
+        width = size + 6
+        all_cells = np.minimum(((pos - low) / span * size).astype(np.intp), size - 1)
+        index = all_cells[:, 0] * size + all_cells[:, 1]
+        cell = all_cells[nodes]
+        cell_mass = np.bincount(index, weights=mass, minlength=size * size)
+        moment_x = np.bincount(index, weights=mass * pos[:, 0], minlength=size * size)
+        moment_y = np.bincount(index, weights=mass * pos[:, 1], minlength=size * size)
+        # Flattened grids padded by three cells on every side, so every offset stays inside them.
+        grid = np.zeros((3, width, width))
+        grid[0, 3:-3, 3:-3] = cell_mass.reshape(size, size)
+        grid[1, 3:-3, 3:-3] = np.divide(moment_x, cell_mass, out=np.zeros(size * size), where=cell_mass > 0).reshape(size, size)
+        grid[2, 3:-3, 3:-3] = np.divide(moment_y, cell_mass, out=np.zeros(size * size), where=cell_mass > 0).reshape(size, size)
+        grid_mass, grid_x, grid_y = grid.reshape(3, -1)
+        home = (cell[:, 0] + 3) * width + cell[:, 1] + 3
+
+        offsets = INTERACTION_OFFSETS[cell[:, 0] & 1, cell[:, 1] & 1]
+        flat = home[:, None] + offsets[:, :, 0] * width + offsets[:, :, 1]
+        push(grid_mass.take(flat), grid_x.take(flat), grid_y.take(flat))
+
+        if level == depth:
+            flat = home[:, None] + NEIGHBOR_OFFSETS[:, 0] * width + NEIGHBOR_OFFSETS[:, 1]
+            push(grid_mass.take(flat), grid_x.take(flat), grid_y.take(flat))
+            # The node's own cell, without the node itself.
+            own = grid_mass.take(home)
+            rest = own - node_mass
+            has_rest = rest > 1e-9 * own
+            rest_x = np.divide(grid_x.take(home) * own - node_pos[:, 0] * node_mass, rest, out=node_pos[:, 0].copy(),
+                               where=has_rest)
+            rest_y = np.divide(grid_y.take(home) * own - node_pos[:, 1] * node_mass, rest, out=node_pos[:, 1].copy(),
+                               where=has_rest)
+            push(np.where(has_rest, rest, 0)[:, None], rest_x[:, None], rest_y[:, None])
+    return force
+
+
+def _quadtree_depth(n):
+    """Quadtree depth at which the deepest cells hold about two nodes."""
+    return int(np.clip(np.ceil(np.log(max(n, 2) / 2) / np.log(4)), 2, 10))
+
+
+def _equilibrium_scale(pos, source, target, mass):
+    """
+    Factor by which pos is scaled to put its nodes closest to force balance.
+
+    Scaling the positions by s scales the edge pull by s^2, the center pull by s and the repulsion by 1 / s, so the
+    squared net force is a polynomial in s, which is minimized over a grid of scales.
+    """
+    n = len(pos)
+    repulsion = _repulsion(pos, mass, _quadtree_depth(n))
+    delta = pos[target] - pos[source]
+    pull = delta * np.sqrt((delta ** 2).sum(axis=1))[:, None]
+    attraction = np.column_stack([np.bincount(source, weights=pull[:, axis], minlength=n)
+                                  - np.bincount(target, weights=pull[:, axis], minlength=n) for axis in (0, 1)])
+    center = -0.01 * (pos - pos.mean(axis=0)) * mass[:, None]
+    scales = np.geomspace(1e-4, 1e4, 321)
+    terms = [(attraction, scales ** 2), (center, scales), (repulsion, 1 / scales)]
+    residual = sum((a * b).sum() * fa * fb for a, fa in terms for b, fb in terms)
+    return float(scales[np.argmin(residual)])
+
+
+def _relax(pos, source, target, weight, mass, iterations, deadline, temperature, movable=None):
+    """
+    Fruchterman-Reingold iterations with Barnes-Hut repulsion and an ideal edge length of 1.
+
+    Every node moves along its net force by at most the temperature, which cools linearly to zero over the
+    iterations. If movable (an array of node indices) is given, only those nodes move and only their forces are
+    computed. Stops early once the deadline (a time.perf_counter() value, or None) has passed.
+    """
+    n = len(pos)
+    depth = _quadtree_depth(n)
+    nodes = slice(None) if movable is None else movable
+    for step in range(iterations):
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+        force = _repulsion(pos, mass, depth, movable)
+        delta = pos[target] - pos[source]
+        pull = delta * (weight * np.sqrt((delta ** 2).sum(axis=1)))[:, None]
+        for axis in (0, 1):
+            force[:, axis] += (np.bincount(source, weights=pull[:, axis], minlength=n)
+                               - np.bincount(target, weights=pull[:, axis], minlength=n))[nodes]
+        # A weak pull towards the center keeps disconnected components from drifting apart.
+        force -= 0.01 * (pos[nodes] - pos.mean(axis=0)) * mass[nodes, None]
+        length = np.maximum(np.sqrt((force ** 2).sum(axis=1)), 1e-12)
+        limit = temperature * (1 - step / iterations)
+        pos[nodes] += force * (np.minimum(length, limit) / length)[:, None]
+    return pos
+
+
+def _seed_positions(G, pos, rng):
+    """
+    Completes pos (a dict of known positions) for every node of G.
+
+    Nodes without a position are placed in waves, each next to the mean position of its already placed neighbors,
+    and nodes that cannot be reached from a placed node are scattered over the bounding box of the placed ones.
+    """
+    placed = {node: np.asarray(xy, dtype=float) for node, xy in pos.items() if node in G}
+    lengths = [np.linalg.norm(placed[u] - placed[v]) for u, v in G.edges() if u in placed and v in placed and u != v]
+    step = float(np.median(lengths)) if lengths else 2 / np.sqrt(max(len(G), 1))
+    missing = [node for node in G if node not in placed]
+    while missing:
+        wave = {}
+        for node in missing:
+            known = [placed[neighbor] for neighbor in G.neighbors(node) if neighbor in placed]
+            if known:
+                wave[node] = np.mean(known, axis=0) + (rng.random(2) - 0.5) * step
+        if not wave:
+            break
+        placed.update(wave)
+        missing = [node for node in missing if node not in wave]
+    if missing:
+        known = np.array(list(placed.values())) if placed else np.array([[-1.0, -1.0], [1.0, 1.0]])
+        low, high = known.min(axis=0), known.max(axis=0)
+        for node in missing:
+            placed[node] = low + rng.random(2) * (high - low)
+    return placed
+
+
+def multilevel_layout(G, iterations=50, time_budget=None, seed=None, pos=None, fixed=None):
+    """
+    Force-directed layout for large graphs, in the spirit of nx.spring_layout but without its all-pairs forces.
+
+    The graph is coarsened into a hierarchy by repeatedly merging matched neighbors until it is small (or stops
+    shrinking), the coarsest graph is laid out from random positions, and each finer level starts from the
+    positions of its coarse nodes and is refined by force iterations. Repulsion uses a Barnes-Hut quadtree
+    approximation, so an iteration costs O(n log n + m) instead of O(n^2).
+
+    Given starting positions, the hierarchy is skipped: nodes missing from pos are placed next to their neighbors,
+    only the nodes not in fixed are relaxed, and the result keeps the coordinates of pos instead of being rescaled,
+    so the fixed nodes stay exactly where they were.
+
+    Parameters:
+    G (nx.Graph): Graph to lay out.
+    iterations (int): Number of force iterations per level. Default is 50.
+    time_budget (float): Seconds the refinement may take in total, shared between the levels by their size; levels
+        that run out of time keep the positions they have. Default is None (no limit).
+    seed (int): Seed for the initial positions. Default is None.
+    pos (dict): Starting positions of some or all nodes. Default is None.
+    fixed (iterable): Nodes of pos that keep their position. Default is None.
+
+    Returns:
+    dict: Node positions, scaled to [-1, 1] and centered on the origin like nx.spring_layout unless pos is given.
+    """
+    nodes = list(G.nodes())
+    n = len(nodes)
+    if n == 0:
+        return {}
+    rng = np.random.default_rng(seed)
+    deadline_start = time.perf_counter()
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = np.array([(index[u], index[v]) for u, v in G.edges() if u != v], dtype=np.intp).reshape(-1, 2)
+    if len(edges):
+        low, high = np.minimum(edges[:, 0], edges[:, 1]), np.maximum(edges[:, 0], edges[:, 1])
+        pairs = np.unique(low * n + high)
+        source, target = pairs // n, pairs % n
+    else:
+        source = target = np.empty(0, dtype=np.intp)
+
+    if pos is not None:
+        start = _seed_positions(G, pos, rng)
+        xy = np.array([start[node] for node in nodes], dtype=float)
+        fixed = set() if fixed is None else set(fixed) & start.keys()
+        movable = np.array([i for i, node in enumerate(nodes) if node not in fixed], dtype=np.intp)
+        if len(movable) == 0:
+            return dict(zip(nodes, xy))
+        # Relax at the scale where the starting layout is closest to balance, so the fixed nodes pull and push the
+        # others the way they did when the layout was made.
+        scale = _equilibrium_scale(xy, source, target, np.ones(n))
+        deadline = None if time_budget is None else deadline_start + time_budget
+        xy = _relax(xy * scale, source, target, np.ones(len(source)), np.ones(n), iterations, deadline, 1.0, movable)
+        return dict(zip(nodes, xy / scale))
+
+    levels = [(n, source, target, np.ones(len(source)), np.ones(n))]
+    parents = []
+    while levels[-1][0] > 64:
+        count, source, target, weight, mass = levels[-1]
+        parent, coarse_count, *coarse = _coarsen(count, source, target, weight, mass, rng)
+        if coarse_count > 0.9 * count:
+            break
+        parents.append(parent)
+        levels.append((coarse_count, *coarse))
+
+    total = sum(level[0] for level in levels)
+    deadline = None
+    pos = (rng.random((levels[-1][0], 2)) - 0.5) * np.sqrt(n)
+    for depth in range(len(levels) - 1, -1, -1):
+        count, source, target, weight, mass = levels[depth]
+        if depth < len(levels) - 1:
+            # Children start on their coarse node, jittered so they do not coincide.
+            pos = pos[parents[depth]] + (rng.random((count, 2)) - 0.5) * 0.1
+        if time_budget is not None:
+            deadline = deadline_start + time_budget * sum(level[0] for level in levels[depth:]) / total
+        temperature = np.sqrt(n) / 10 if depth == len(levels) - 1 else np.sqrt(n / count)
+        pos = _relax(pos, source, target, weight, mass, iterations, deadline, temperature)
+
+    pos -= pos.mean(axis=0)
+    pos /= max(float(np.abs(pos).max()), 1e-12)
+    return dict(zip(nodes, pos))
+
+
+def graph_fingerprint(G, *parts):
+    """Hashes the nodes and edges of G, ignoring their order and attributes, together with the repr of parts."""
+    names = {node: repr(node) for node in G.nodes()}
+    edges = sorted(sorted((names[u], names[v])) for u, v in G.edges())
+    content = json.dumps([sorted(names.values()), edges, [repr(part) for part in parts]])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class _NpzCache:
+    """On-disk cache of .npz entries keyed by a hex digest, keeping the max_entries most recently used entries."""
+
+    def __init__(self, cache_dir, max_entries=32):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def _load(self, path):
+        with np.load(path, allow_pickle=False) as entry:
+            return {name: entry[name] for name in entry.files}
+
+    def _save(self, key, **arrays):
+        path = self._path(key)
+        with open(f'{path}.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(f'{path}.tmp', path)
+        self._evict()
+
+    def _evict(self):
+        entries = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(self.cache_dir)
+                         if entry.name.endswith('.npz'))
+        for _, path in entries[:max(len(entries) - self.max_entries, 0)]:
+            os.remove(path)
+
+
+class LayoutCache(_NpzCache):
+    """
+    On-disk cache of node positions keyed by graph fingerprint, keeping the max_entries most recently used layouts.
+
+    Every entry also stores the nodes (by repr) and edges of its graph, so a graph that is not cached can start
+    from the cached layout sharing most of its nodes.
+    """
+
+    def get(self, G, key):
+        """Returns the cached positions of the nodes of G, or None on a miss."""
+        path = self._path(key)
+        try:
+            entry = self._load(path)
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        cached = dict(zip(entry['nodes'].tolist(), entry['pos']))
+        pos = {node: cached.get(repr(node)) for node in G.nodes()}
+        return None if any(xy is None for xy in pos.values()) else pos
+
+    def nearest(self, G, layout, min_overlap=0.5):
+        """
+        Returns the positions and edges of the cached layout made by the same layout engine that shares the most
+        nodes with G, or None if none shares at least min_overlap of them.
+
+        The positions are keyed by the nodes of G; the edges are a set of frozensets of node reprs.
+        """
+        names = {repr(node): node for node in G.nodes()}
+        best, best_overlap = None, min_overlap * len(names)
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.npz'):
+                continue
+            with np.load(entry.path, allow_pickle=False) as cached:
+                if 'layout' not in cached.files or str(cached['layout']) != layout:
+                    continue
+                overlap = len(names.keys() & set(cached['nodes'].tolist()))
+            if overlap >= best_overlap and overlap > 0:
+                best, best_overlap = entry.path, overlap
+        if best is None:
+            return None
+        entry = self._load(best)
+        cached_nodes = entry['nodes'].tolist()
+        pos = {names[name]: xy for name, xy in zip(cached_nodes, entry['pos']) if name in names}
+        edges = {frozenset((cached_nodes[u], cached_nodes[v])) for u, v in entry['edges'].tolist()}
+        return pos, edges
+
+    def put(self, key, G, pos, layout):
+        """Stores the positions of the nodes of G under key and evicts the oldest layouts beyond max_entries."""
+        nodes = list(G.nodes())
+        index = {node: i for i, node in enumerate(nodes)}
+        self._save(key, nodes=np.array([repr(node) for node in nodes], dtype=str),
+                   edges=np.array([(index[u], index[v]) for u, v in G.edges()], dtype=np.intp).reshape(-1, 2),
+                   pos=np.array([pos[node] for node in nodes], dtype=float).reshape(-1, 2),
+                   layout=np.array(layout))
+
+
+class CommunityCache(_NpzCache):
+    """On-disk cache of community labels keyed by adjacency_fingerprint, keeping the max_entries most recent."""
+
+    def get(self, key):
+        """Returns the cached labels, in the node order of the fingerprinted matrix, or None on a miss."""
+        path = self._path(key)
+        try:
+            entry = self._load(path)
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return entry['labels']
+
+    def put(self, key, labels):
+        """Stores labels under key and evicts the oldest entries beyond max_entries."""
+        self._save(key, labels=np.asarray(labels, dtype=np.intp))
+
+
+def warm_start(G, previous_pos, previous_edges, seed=None):
+    """
+    Prepares a layout of G from the layout of a previous version of the graph.
+
+    The nodes that are new, or whose edges changed, are affected, along with their neighbors; every other node keeps
+    its previous position. New nodes are placed next to their neighbors.
+
+    Parameters:
+    G (nx.Graph): Graph to lay out.
+    previous_pos (dict): Previous positions of the nodes of G that existed before.
+    previous_edges (set): Previous edges, as frozensets of node reprs.
+    seed (int): Seed for the placement of new nodes. Default is None.
+
+    Returns:
+    tuple: Starting positions of every node and the list of nodes to keep fixed.
+    """
+    names = {node: repr(node) for node in G.nodes()}
+    edges = {frozenset((names[u], names[v])) for u, v in G.edges()}
+    changed = {name for edge in edges ^ previous_edges for name in edge}
+    affected = {node for node in G.nodes() if node not in previous_pos or names[node] in changed}
+    affected.update([neighbor for node in affected for neighbor in G.neighbors(node)])
+    pos = _seed_positions(G, previous_pos, np.random.default_rng(seed))
+    return pos, [node for node in G.nodes() if node not in affected]
+
+
+def _compute_layout(G, layout, iterations, time_budget, pos=None, fixed=None):
+    # Warm starts relax only the free nodes, with the Barnes-Hut forces of multilevel_layout whichever engine made
+    # the starting layout; nx.spring_layout would still compute the forces between all pairs of nodes.
+    if layout == 'multilevel' or pos is not None:
+        return multilevel_layout(G, iterations=iterations, time_budget=time_budget, pos=pos, fixed=fixed)
+    return nx.spring_layout(G, iterations=iterations)
+
+
+def adjacency_matrix(data, source_col, target_col):
+    """
+    Builds the symmetric, unweighted CSR adjacency matrix of an edge list without going through NetworkX.
+
+    Nodes are ordered by their repr, so equal graphs give equal matrices whatever the order of their rows, and
+    repeated edges collapse into one like in nx.from_pandas_edgelist. Rows with a missing endpoint are skipped.
+
+    Parameters:
+    data (pd.DataFrame): Edge list.
+    source_col (str): Column name of the source nodes.
+    target_col (str): Column name of the target nodes.
+
+    Returns:
+    tuple: The list of nodes and their adjacency matrix (scipy.sparse.csr_matrix).
+    """
+    data = data[[source_col, target_col]].dropna()
+    codes, uniques = pd.factorize(pd.concat([data[source_col], data[target_col]], ignore_index=True))
+    names = np.array([repr(node) for node in uniques], dtype=str)
+    order = np.argsort(names, kind='stable')
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order))
+    codes = rank[codes]
+    n, m = len(uniques), len(data)
+    row = np.concatenate([codes[:m], codes[m:]])
+    col = np.concatenate([codes[m:], codes[:m]])
+    A = sp.csr_matrix((np.ones(2 * m), (row, col)), shape=(n, n))
+    A.sum_duplicates()
+    A.data[:] = 1.0
+    return pd.Index(uniques).take(order).tolist(), A
+
+
+def adjacency_fingerprint(nodes, A, *parts):
+    """Hashes an adjacency matrix from adjacency_matrix, its nodes and the repr of parts."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([repr(node) for node in nodes] + [repr(part) for part in parts]).encode('utf-8'))
+    for array in (A.indptr, A.indices, A.data):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def _local_moving(A, rng, max_sweeps, move_fraction):
+    """
+    Louvain local-moving phase over the arrays of a CSR adjacency matrix.
+
+    In every sweep each node finds the neighboring community with the largest modularity gain, and a random
+    move_fraction of the nodes that gain by moving move at once (moving all of them would let neighbors swap
+    communities back and forth). Stops when no node gains by moving or after max_sweeps sweeps. Returns the
+    community of every node, numbered from 0.
+    """
+    n = A.shape[0]
+    row = np.repeat(np.arange(n), np.diff(A.indptr))
+    degree = np.bincount(row, weights=A.data, minlength=n)
+    total_weight = degree.sum()
+    off_diagonal = row != A.indices
+    row, col, weight = row[off_diagonal], A.indices[off_diagonal], A.data[off_diagonal]
+    community = np.arange(n)
+    community_degree = degree.copy()
+    for _ in range(max_sweeps):
+        pairs, inverse = np.unique(row * n + community[col], return_inverse=True)
+        if len(pairs) == 0:
+            break
+        links = np.bincount(inverse, weights=weight, minlength=len(pairs))
+        node, target = pairs // n, pairs % n
+        own = target == community[node]
+        # Gain of joining each neighboring community, from the community the node is taken out of.
+        gain = links - degree[node] * (community_degree[target] - np.where(own, degree[node], 0)) / total_weight
+        stay = -degree * (community_degree[community] - degree) / total_weight
+        stay[node[own]] += links[own]
+        # The pairs are sorted by node, so every node's best community is the maximum of its segment.
+        starts = np.flatnonzero(np.r_[True, node[1:] != node[:-1]])
+        segment_best = np.maximum.reduceat(gain, starts)
+        ties = np.flatnonzero(gain == np.repeat(segment_best, np.diff(np.r_[starts, len(node)])))
+        first = ties[np.r_[True, node[ties][1:] != node[ties][:-1]]]
+        best = np.full(n, -1, dtype=np.intp)
+        best_gain = np.full(n, -np.inf)
+        best[node[first]], best_gain[node[first]] = target[first], gain[first]
+        moving = (best >= 0) & (best != community) & (best_gain > stay + 1e-12 * total_weight)
+        if not moving.any():
+            break
+        moving &= rng.random(n) < move_fraction
+        community_degree -= np.bincount(community[moving], weights=degree[moving], minlength=n)
+        community[moving] = best[moving]
+        community_degree += np.bincount(community[moving], weights=degree[moving], minlength=n)
+    return np.unique(community, return_inverse=True)[1].reshape(-1)
+
+
+def sparse_communities(A, seed=None, max_sweeps=32, move_fraction=0.5):
+    """
+    Louvain community detection on a symmetric SciPy sparse adjacency matrix, without a NetworkX graph.
+
+    Alternates the local-moving phase with the aggregation of every community into one node (the matrix product
+    P.T @ A @ P with P the membership matrix) until the communities stop merging.
+
+    Parameters:
+    A (scipy.sparse matrix): Symmetric adjacency matrix, e.g. from adjacency_matrix.
+    seed (int): Seed for picking the nodes that move in each sweep. Default is None.
+    max_sweeps (int): Maximum number of local-moving sweeps per level. Default is 32.
+    move_fraction (float): Fraction of the improving nodes moved in each sweep. Default is 0.5.
+
+    Returns:
+    np.ndarray: Community of every node, numbered from 0.
+    """
+    rng = np.random.default_rng(seed)
+    A = sp.csr_matrix(A, dtype=float)
+    labels = np.arange(A.shape[0])
+    while A.shape[0] > 0:
+        community = _local_moving(A, rng, max_sweeps, move_fraction)
+        n_communities = int(community.max()) + 1
+        if n_communities == A.shape[0]:
+            break
+        labels = community[labels]
+        membership = sp.csr_matrix((np.ones(len(community)), (np.arange(len(community)), community)),
+                                   shape=(len(community), n_communities))
+        A = (membership.T @ A @ membership).tocsr()
+    return labels
+
+
+def detect_communities(G, data, source_col, target_col, backend='louvain', cache_dir=None, cache_entries=32):
+    """
+    Finds the communities of the network, with python-louvain on G or with sparse_communities on the CSR
+    adjacency matrix of data, optionally caching the labels on disk keyed by adjacency_fingerprint (and, for
+    python-louvain, the 'weight' column it weighs edges by). Nodes left out of the matrix because their rows miss
+    an endpoint get a community of their own.
+
+    Parameters:
+    G (nx.Graph): Graph built from data.
+    data (pd.DataFrame): Edge list.
+    source_col (str): Column name of the source nodes.
+    target_col (str): Column name of the target nodes.
+    backend (str): 'louvain' for community_louvain.best_partition or 'sparse' for sparse_communities. Default is 'louvain'.
+    cache_dir (str): Directory of cached labels. Default is None (no cache).
+    cache_entries (int): Number of label sets kept in cache_dir. Default is 32.
+
+    Returns:
+    dict: Community of every node.
+    """
+    if backend == 'louvain' and cache_dir is None:
+        return community_louvain.best_partition(G)
+    nodes, A = adjacency_matrix(data, source_col, target_col)
+    labels = None
+    if cache_dir is not None:
+        cache = CommunityCache(cache_dir, cache_entries)
+        parts = [backend]
+        if backend == 'louvain' and 'weight' in data.columns:
+            parts.append(hashlib.sha256(pd.util.hash_pandas_object(data['weight'], index=False).to_numpy()).hexdigest())
+        key = adjacency_fingerprint(nodes, A, *parts)
+        labels = cache.get(key)
+    if labels is None:
+        if backend == 'sparse':
+            labels = sparse_communities(A)
+        else:
+            partition = community_louvain.best_partition(G)
+            labels = np.array([partition[node] for node in nodes], dtype=np.intp)
+        if cache_dir is not None:
+            cache.put(key, labels)
+    communities = dict(zip(nodes, labels.tolist()))
+    next_label = max(communities.values(), default=-1) + 1
+    for node in G.nodes():
+        if node not in communities:
+            communities[node] = next_label
+            next_label += 1
+    return communities
+
+
+def edge_width_traces(G, pos, edge_weight_col=None, width_classes=4, color='#888'):
+    """
+    Builds one WebGL line trace per edge width class instead of one trace per edge.
+
+    Edge widths are the edge_weight_col values (1 without it). If there are at most width_classes distinct widths,
+    each gets its own trace; otherwise the widths are split into width_classes equal bins, each drawn at the mean
+    width of its edges. The edges of a trace share one coordinate array in which every edge is followed by a gap
+    (NaN, which Plotly draws as a break in the line), so the figure grows with the number of edges rather than the
+    number of traces.
+
+    Parameters:
+    G (nx.Graph): Graph whose edges are drawn.
+    pos (dict): Node positions, as returned by the layout.
+    edge_weight_col (str): Edge attribute holding the edge widths. Default is None.
+    width_classes (int): Maximum number of edge traces. Default is 4.
+    color (str): Edge color. Default is '#888'.
+
+    Returns:
+    list: The edge traces, thinnest first.
+    """
+    if G.number_of_edges() == 0:
+        return []
+    index = {node: i for i, node in enumerate(G.nodes())}
+    xy = np.array([pos[node] for node in G.nodes()], dtype=float)
+    edges = list(G.edges(data=True))
+    source = np.fromiter((index[u] for u, _, _ in edges), dtype=np.intp, count=len(edges))
+    target = np.fromiter((index[v] for _, v, _ in edges), dtype=np.intp, count=len(edges))
+    widths = np.fromiter(((attrs.get(edge_weight_col, 1) if edge_weight_col else 1) for _, _, attrs in edges),
+                         dtype=float, count=len(edges))
+
+    levels, classes = np.unique(widths, return_inverse=True)
+    if len(levels) > width_classes:
+        bins = np.linspace(widths.min(), widths.max(), width_classes + 1)
+        classes = np.clip(np.digitize(widths, bins[1:-1]), 0, width_classes - 1)
+        levels = np.array([widths[classes == k].mean() if (classes == k).any() else np.nan
+                           for k in range(width_classes)])
+
+    traces = []
+    for k, width in enumerate(levels):
+        members = np.flatnonzero(classes == k)
+        if len(members) == 0:
+            continue
+        gap = np.full(len(members), np.nan)
+        x = np.column_stack([xy[source[members], 0], xy[target[members], 0], gap]).ravel()
+        y = np.column_stack([xy[source[members], 1], xy[target[members], 1], gap]).ravel()
+        traces.append(go.Scattergl(
+            x=x, y=y,
+            line=dict(width=float(width), color=color),
+            hoverinfo='none',
+            mode='lines'
+        ))
+    return traces
+
+def network_map(data, source_col, target_col, edge_weight_col=None, node_size_col=None, node_color_col=None, colorscale='Viridis', interactive=False, community_detection=False, edge_width_classes=4, layout='spring', layout_iterations=50, layout_time_budget=None, layout_cache_dir=None, layout_cache_entries=32, community_backend='louvain', community_cache_dir=None):
     """
     Function to create a network map from any dataset.
     
@@ -17,39 +685,52 @@ def network_map(data, source_col, target_col, edge_weight_col=None, node_size_co
     colorscale (str): Colorscale to use for the node colors. Default is 'Viridis'.
     interactive (bool): Whether to create an interactive network map. Default is False.
     community_detection (bool): Whether to apply community detection algorithm to find communities in the network. Default is False.
+    edge_width_classes (int): Number of width classes the edges are bucketed into, each drawn as a single trace. Default is 4.
+    layout (str): Layout engine, 'spring' for nx.spring_layout or 'multilevel' for multilevel_layout, which scales to much larger graphs. Default is 'spring'.
+    layout_iterations (int): Number of force iterations (per level for 'multilevel'). Default is 50.
+    layout_time_budget (float): Seconds the 'multilevel' layout may take before it stops refining. Default is None (no limit).
+    layout_cache_dir (str): Directory of layouts reused across runs. An unchanged graph reuses its layout, and a changed graph starts from the closest cached layout, relaxing only the new nodes and those whose edges changed (with the Barnes-Hut forces of the 'multilevel' engine, whichever layout is selected). Default is None (no cache).
+    layout_cache_entries (int): Number of layouts kept in layout_cache_dir. Default is 32.
+    community_backend (str): Community detection backend, 'louvain' for python-louvain on the NetworkX graph or 'sparse' for sparse_communities on a SciPy CSR adjacency matrix, which scales to millions of edges. Default is 'louvain'.
+    community_cache_dir (str): Directory of community labels reused across runs, keyed by graph fingerprint. Default is None (no cache).
     
     Returns:
     None
     """
+    if edge_width_classes < 1:
+        raise ValueError("edge_width_classes must be at least 1.")
+    if layout not in ('spring', 'multilevel'):
+        raise ValueError("layout must be 'spring' or 'multilevel'.")
+    if community_backend not in ('louvain', 'sparse'):
+        raise ValueError("community_backend must be 'louvain' or 'sparse'.")
     G = nx.from_pandas_edgelist(data, source=source_col, target=target_col, edge_attr=True)
     
     if community_detection:
-        community_dict = community_louvain.best_partition(G)
+        community_dict = detect_communities(G, data, source_col, target_col, community_backend, community_cache_dir)
         nx.set_node_attributes(G, community_dict, 'community')
     else:
         community_dict = {node: 0 for node in G.nodes()}
     
-    pos = nx.spring_layout(G)
+    if layout_cache_dir is None:
+        pos = _compute_layout(G, layout, layout_iterations, layout_time_budget)
+    else:
+        layout_cache = LayoutCache(layout_cache_dir, layout_cache_entries)
+        layout_key = graph_fingerprint(G, layout, layout_iterations)
+        pos = layout_cache.get(G, layout_key)
+        if pos is None:
+            previous = layout_cache.nearest(G, layout)
+            start, fixed = (None, None) if previous is None else warm_start(G, *previous)
+            pos = _compute_layout(G, layout, layout_iterations, layout_time_budget, start, fixed)
+            layout_cache.put(layout_key, G, pos, layout)
     node_x = [pos[node][0] for node in G.nodes()]
     node_y = [pos[node][1] for node in G.nodes()]
     
     node_sizes = nx.get_node_attributes(G, node_size_col) if node_size_col else {node: 10 for node in G.nodes()}
     node_colors = nx.get_node_attributes(G, node_color_col) if node_color_col else {node: 1 for node in G.nodes()}
     
-    edge_traces = [
-        go.Scatter(
-            x=[x0, x1], 
-            y=[y0, y1],
-            line=dict(width=edge[2].get(edge_weight_col, 1) if edge_weight_col else 1, color='#888'),
-            hoverinfo='none',
-            mode='lines'
-        )
-        for edge in G.edges(data=True)
-        for x0, y0 in [pos[edge[0]]]
-        for x1, y1 in [pos[edge[1]]]
-    ]
+    edge_traces = edge_width_traces(G, pos, edge_weight_col, edge_width_classes)
     
-    node_trace = go.Scatter(
+    node_trace = go.Scattergl(
         x=node_x, y=node_y,
         mode='markers+text',
         hoverinfo='text',
@@ -60,9 +741,8 @@ def network_map(data, source_col, target_col, edge_weight_col=None, node_size_co
             size=list(node_sizes.values()),
             colorbar=dict(
                 thickness=15,
-                title='Node Metrics',
-                xanchor='left',
-                titleside='right'
+                title=dict(text='Node Metrics', side='right'),
+                xanchor='left'
             ),
             line=dict(width=2)
         ),
@@ -72,8 +752,7 @@ def network_map(data, source_col, target_col, edge_weight_col=None, node_size_co
 
     fig = go.Figure(data=[*edge_traces, node_trace],
                     layout=go.Layout(
-                        title='Network Graph',
-                        titlefont_size=16,
+                        title=dict(text='Network Graph', font=dict(size=16)),
                         showlegend=False,
                         hovermode='closest',
                         margin=dict(b=20, l=5, r=5, t=40),
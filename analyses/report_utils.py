@@ -0,0 +1,616 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import types
+import weakref
+import zipfile
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from pptx import Presentation
+from pptx.util import Inches
+from PIL import Image
+
+
+SLIDE_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.presentationml.slide+xml'
+SLIDE_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide'
+
+# Column profiles keyed by id() of the profiled DataFrame; entries are dropped when the frame is garbage collected.
+_profile_cache = {}
+
+# Tick label text properties FigurePool puts back when recycling a figure.
+TICK_LABEL_PROPERTIES = ('rotation', 'rotation_mode', 'horizontalalignment', 'verticalalignment', 'fontsize',
+                         'fontweight', 'fontstyle', 'color', 'visible')
+
+# Subplot parameters computed by tight_layout, keyed by _layout_key; the oldest entries go past LAYOUT_CACHE_SIZE.
+_layout_cache = {}
+LAYOUT_CACHE_SIZE = 1024
+
+
+class StreamingDeck:
+    """
+    PowerPoint deck for the batch reports that keeps only slide metadata in memory.
+
+    Every slide is a 'Title Only' slide holding one picture, like the slides the all_* reports used to add through
+    python-pptx. Images are spooled to files in spool_dir as slides are added and are streamed into the .pptx
+    package by save(), so peak memory does not grow with the number of slides. Images are stored by their content
+    hash, so slides showing identical images share one spooled file and one media part in the package.
+
+    With checkpoint_dir set, images are spooled to a 'deck_checkpoint' directory the deck creates inside it (so
+    removing the checkpoint never touches anything else in checkpoint_dir), and every slide added with an integer key is also recorded in
+    a journal, together with run_key identifying the report run. A deck created with resume=True and the same
+    run_key reloads the journaled slides, lists their keys in `completed` so the caller can skip that work, and
+    orders all slides by key when saving. The checkpoint is removed once the deck has been saved.
+    """
+
+    def __init__(self, spool_dir=None, slide_layout=5, checkpoint_dir=None, run_key=None, resume=False):
+        if checkpoint_dir is not None:
+            spool_dir = os.path.join(checkpoint_dir, 'deck_checkpoint')
+        self._owns_spool = spool_dir is None or checkpoint_dir is not None
+        self.spool_dir = tempfile.mkdtemp(prefix='deck_') if spool_dir is None else spool_dir
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.slides = []
+        self.completed = set()
+        self._checkpoint_dir = checkpoint_dir
+        self._journal = None
+        self._load_template(slide_layout)
+        if checkpoint_dir is not None:
+            self._open_journal(run_key, resume)
+
+    def _open_journal(self, run_key, resume):
+        """Restores the slides of an interrupted run with the same run_key, or starts a fresh journal."""
+        path = os.path.join(self.spool_dir, 'journal.jsonl')
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                lines = f.read().splitlines()
+            if lines and json.loads(lines[0]).get('run') == run_key:
+                for line in lines[1:]:
+                    try:
+                        slide = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The run was killed while writing this line.
+                        break
+                    if os.path.exists(slide['path']):
+                        self.slides.append(slide)
+                        self.completed.add(slide['key'])
+                print(f'Resuming from {len(self.slides)} completed slides in {self.spool_dir}')
+            else:
+                print(f'Checkpoint in {self.spool_dir} belongs to a different run, starting over')
+
+        if not self.slides:
+            shutil.rmtree(self.spool_dir)
+            os.makedirs(self.spool_dir)
+            with open(path, 'w') as f:
+                f.write(json.dumps({'run': run_key}) + '\n')
+        self._journal = open(path, 'a')
+
+    def _load_template(self, slide_layout):
+        """Builds a one-slide deck with python-pptx and keeps its parts as templates for the streamed slides."""
+        placeholder = BytesIO()
+        Image.new('RGB', (1, 1)).save(placeholder, format='PNG')
+        template = Presentation()
+        slide = template.slides.add_slide(template.slide_layouts[slide_layout])
+        slide.shapes.add_picture(placeholder, 0, 0, Inches(1), Inches(1))
+        package = BytesIO()
+        template.save(package)
+
+        with zipfile.ZipFile(package) as zf:
+            parts = {name: zf.read(name) for name in zf.namelist()}
+        self._slide_xml = parts.pop('ppt/slides/slide1.xml').decode('utf-8')
+        self._slide_rels = parts.pop('ppt/slides/_rels/slide1.xml.rels').decode('utf-8')
+        media = re.search(r'Target="\.\./media/([^"]+)"', self._slide_rels).group(1)
+        parts.pop(f'ppt/media/{media}')
+        self._media_target = f'../media/{media}'
+
+        # Strip the template slide from the package-level parts; save() adds the real slides back.
+        content_types = parts.pop('[Content_Types].xml').decode('utf-8')
+        self._content_types = re.sub(r'<Override PartName="/ppt/slides/slide1\.xml"[^>]*/>', '', content_types)
+        rels = parts.pop('ppt/_rels/presentation.xml.rels').decode('utf-8')
+        self._presentation_rels = re.sub(r'<Relationship Id="[^"]+" Type="%s"[^>]*/>' % re.escape(SLIDE_REL_TYPE), '', rels)
+        self._presentation_xml = parts.pop('ppt/presentation.xml').decode('utf-8')
+        self._first_rid = max(int(rid) for rid in re.findall(r'Id="rId(\d+)"', self._presentation_rels)) + 1
+        self._parts = parts
+
+    def __len__(self):
+        return len(self.slides)
+
+    def add_picture_slide(self, img_stream, left, top, width, height, ext='png', key=None):
+        """
+        Spools the image in img_stream to disk and records a slide showing it at the given position and size.
+
+        key is the integer position of the slide's work item in the report; it is journaled when checkpointing.
+        """
+        image = img_stream.getvalue() if isinstance(img_stream, BytesIO) else img_stream.read()
+        path = os.path.join(self.spool_dir, f'{hashlib.sha256(image).hexdigest()}.{ext}')
+        if not os.path.exists(path):
+            # Write under a temporary name so a killed run never leaves a truncated image behind the hash.
+            with open(f'{path}.tmp', 'wb') as f:
+                f.write(image)
+            os.replace(f'{path}.tmp', path)
+        slide = {'key': key, 'path': path, 'ext': ext, 'left': int(left), 'top': int(top),
+                 'width': int(width), 'height': int(height)}
+        self.slides.append(slide)
+        if self._journal is not None and key is not None:
+            self._journal.write(json.dumps(slide) + '\n')
+            self._journal.flush()
+            self.completed.add(key)
+
+    def _slide_part(self, slide, media):
+        xml = re.sub(r'<a:off x="\d+" y="\d+"/><a:ext cx="\d+" cy="\d+"/>',
+                     f'<a:off x="{slide["left"]}" y="{slide["top"]}"/>'
+                     f'<a:ext cx="{slide["width"]}" cy="{slide["height"]}"/>', self._slide_xml)
+        xml = re.sub(r'descr="[^"]*"', f'descr="{media}"', xml)
+        rels = self._slide_rels.replace(self._media_target, f'../media/{media}')
+        return xml, rels
+
+    def save(self, filename):
+        """Writes the deck to filename, streaming the spooled images into the package one at a time."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+            self.slides.sort(key=lambda slide: -1 if slide['key'] is None else slide['key'])
+        slide_ids = ''.join(f'<p:sldId id="{256 + i}" r:id="rId{self._first_rid + i}"/>' for i in range(len(self.slides)))
+        presentation_xml = re.sub(r'<p:sldIdLst>.*?</p:sldIdLst>|<p:sldIdLst/>', f'<p:sldIdLst>{slide_ids}</p:sldIdLst>',
+                                  self._presentation_xml)
+        slide_rels = ''.join(f'<Relationship Id="rId{self._first_rid + i}" Type="{SLIDE_REL_TYPE}" '
+                             f'Target="slides/slide{i + 1}.xml"/>' for i in range(len(self.slides)))
+        presentation_rels = self._presentation_rels.replace('</Relationships>', slide_rels + '</Relationships>')
+        overrides = ''.join(f'<Override PartName="/ppt/slides/slide{i + 1}.xml" ContentType="{SLIDE_CONTENT_TYPE}"/>'
+                            for i in range(len(self.slides)))
+        content_types = self._content_types.replace('</Types>', overrides + '</Types>')
+
+        partial = f'{filename}.part'
+        with zipfile.ZipFile(partial, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('[Content_Types].xml', content_types)
+            zf.writestr('ppt/presentation.xml', presentation_xml)
+            zf.writestr('ppt/_rels/presentation.xml.rels', presentation_rels)
+            for name, part in self._parts.items():
+                zf.writestr(name, part)
+            media = {}
+            for number, slide in enumerate(self.slides, start=1):
+                if slide['path'] not in media:
+                    media[slide['path']] = f'image{len(media) + 1}.{slide["ext"]}'
+                    # Images are already compressed, so store them as they are.
+                    zf.write(slide['path'], f'ppt/media/{media[slide["path"]]}', compress_type=zipfile.ZIP_STORED)
+                xml, rels = self._slide_part(slide, media[slide['path']])
+                zf.writestr(f'ppt/slides/slide{number}.xml', xml)
+                zf.writestr(f'ppt/slides/_rels/slide{number}.xml.rels', rels)
+        os.replace(partial, filename)
+        self.cleanup()
+
+    def cleanup(self):
+        """Removes the spool directory if the deck created it or it holds a checkpoint."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self._owns_spool and os.path.isdir(self.spool_dir):
+            shutil.rmtree(self.spool_dir)
+            if self._checkpoint_dir is not None:
+                # Only succeeds if the checkpoint was all there was in checkpoint_dir.
+                try:
+                    os.rmdir(self._checkpoint_dir)
+                except OSError:
+                    pass
+
+
+class FigurePool:
+    """
+    Recycles single-axes Figures for batch rendering instead of building and tearing down a Figure, Axes, spines
+    and tick machinery for every plot.
+
+    subplots() hands out a (fig, ax) pair like plt.subplots(). Released figures have their plotted artists, labels,
+    data limits, color cycle, axis scales, grid, tick locators and formatters and tick label text properties (e.g.
+    a rotation set through set_xticklabels) put back, while the Axes, its Axis objects and their cached ticks are
+    kept. Tick parameters changed with tick_params are not reset. Figures that gained extra axes (e.g. a colorbar) or
+    axis units (dates, categories) are dropped instead of recycled. Pooled figures are not registered with pyplot
+    and cannot be shown with plt.show().
+    """
+
+    def __init__(self, max_size=4):
+        self.max_size = max_size
+        self._free = []
+        self._defaults = weakref.WeakKeyDictionary()
+
+    def subplots(self):
+        if self._free:
+            fig = self._free.pop()
+            return fig, fig.axes[0]
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        self._defaults[fig] = [(axis.get_major_locator(), axis.get_major_formatter(),
+                                [self._label_properties(tick) for tick in (axis.majorTicks[0], axis.minorTicks[0])])
+                               for axis in (ax.xaxis, ax.yaxis)]
+        return fig, ax
+
+    @staticmethod
+    def _label_properties(tick):
+        return [{name: getattr(label, f'get_{name}')() for name in TICK_LABEL_PROPERTIES}
+                for label in (tick.label1, tick.label2)]
+
+    def release(self, fig):
+        """Clears fig and returns it to the pool; figures the pool did not create are ignored."""
+        if fig not in self._defaults or len(fig.axes) != 1 or len(self._free) >= self.max_size:
+            return
+        ax = fig.axes[0]
+        # Dates and categories install a unit converter, locator and formatter on the axis that later plots would
+        # inherit, so those figures are dropped like the ones that gained a colorbar.
+        if ax.xaxis.have_units() or ax.yaxis.have_units():
+            return
+        for artist in [*ax.collections, *ax.lines, *ax.patches, *ax.texts, *ax.images, *ax.artists, *ax.tables]:
+            artist.remove()
+        ax.containers.clear()
+        if ax.legend_ is not None:
+            ax.legend_.remove()
+        ax.set_title('')
+        ax.set_xlabel('')
+        ax.set_ylabel('')
+        # Setting the scale replaces the locators and formatters, so it goes before they are restored.
+        ax.set_xscale('linear')
+        ax.set_yscale('linear')
+        ax.grid(False)
+        if plt.rcParams['axes.grid']:
+            ax.grid(True, which=plt.rcParams['axes.grid.which'], axis=plt.rcParams['axes.grid.axis'])
+        for axis, (locator, formatter, label_defaults) in zip((ax.xaxis, ax.yaxis), self._defaults[fig]):
+            axis.set_major_locator(locator)
+            axis.set_major_formatter(formatter)
+            for ticks, (label1, label2) in zip((axis.majorTicks, axis.minorTicks), label_defaults):
+                for tick in ticks:
+                    tick.label1.update(label1)
+                    tick.label2.update(label2)
+        ax.set_prop_cycle(None)
+        ax.relim()
+        ax.set_autoscale_on(True)
+        fig.subplots_adjust(**{name: plt.rcParams[f'figure.subplot.{name}']
+                               for name in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')})
+        self._free.append(fig)
+
+
+def figure_to_png(fig, pool=None):
+    """Renders fig to PNG bytes and closes it, or returns it to pool if given."""
+    img_stream = BytesIO()
+    fig.savefig(img_stream, format='png')
+    plt.close(fig)
+    if pool is not None:
+        pool.release(fig)
+    return img_stream.getvalue()
+
+
+def _text_key(text, bucket):
+    """Layout-relevant summary of a Text: its length rounded up to bucket characters, font size and rotation."""
+    if text is None or not text.get_visible() or not text.get_text():
+        return None
+    return -(-len(text.get_text()) // bucket), text.get_fontsize(), text.get_rotation()
+
+
+def _tick_labels_key(axis):
+    """Longest visible tick label of axis, with its font size and rotation."""
+    labels = [label for label in axis.get_majorticklabels() if label.get_text()]
+    if not labels:
+        return None
+    longest = max(labels, key=lambda label: len(label.get_text()))
+    return len(longest.get_text()), longest.get_fontsize(), longest.get_rotation()
+
+
+def _layout_key(fig):
+    """
+    Summarizes everything tight_layout measures on fig: the figure size, font family, axes grid and, per axes, the
+    lengths of its tick labels (exact, as they set the margins) and titles and axis labels (in 8 character buckets,
+    as they only matter once they overflow the axes).
+    """
+    parts = [tuple(fig.get_size_inches()), fig.dpi, tuple(plt.rcParams['font.family']),
+             _text_key(fig._suptitle, 8)]
+    for ax in fig.axes:
+        spec = ax.get_subplotspec()
+        if not ax.get_visible():
+            parts.append(None)
+            continue
+        parts.append((ax.get_label(), spec and (spec.get_geometry(), spec.rowspan, spec.colspan),
+                      _text_key(ax.title, 8), _text_key(ax.xaxis.label, 8), _text_key(ax.yaxis.label, 8),
+                      _tick_labels_key(ax.xaxis), _tick_labels_key(ax.yaxis),
+                      max((_text_key(text, 4) for text in ax.texts if text.get_visible()), default=None,
+                          key=lambda key: key or ())))
+    return tuple(parts)
+
+
+def cached_tight_layout(fig):
+    """
+    Same as fig.tight_layout(), but reuses the subplot parameters computed for an earlier figure with the same
+    _layout_key instead of measuring every text extent again. Batch reports draw hundreds of figures from one
+    template, so the full layout only runs for the first figure of each shape.
+    """
+    key = _layout_key(fig)
+    params = _layout_cache.get(key)
+    if params is None:
+        fig.tight_layout()
+        subplotpars = fig.subplotpars
+        params = dict(left=subplotpars.left, right=subplotpars.right, bottom=subplotpars.bottom,
+                      top=subplotpars.top, wspace=subplotpars.wspace, hspace=subplotpars.hspace)
+        if len(_layout_cache) >= LAYOUT_CACHE_SIZE:
+            del _layout_cache[next(iter(_layout_cache))]
+        _layout_cache[key] = params
+    else:
+        fig.subplots_adjust(**params)
+    return fig
+
+
+def slide_image_dpi(fig, width, slide_dpi):
+    """Figure dpi giving slide_dpi pixels per inch once fig is placed width EMU wide on a slide."""
+    return slide_dpi * (width / Inches(1)) / fig.get_size_inches()[0]
+
+
+def rasterize_figure(fig, pool=None, dpi=None):
+    """
+    Closes fig (or returns it to pool if given) and draws it with Agg at dpi (default: the figure's own), returning
+    its RGBA pixels as an array.
+    """
+    plt.close(fig)
+    canvas = FigureCanvasAgg(fig)
+    figure_dpi = fig.dpi
+    if dpi is not None:
+        fig.dpi = dpi
+    canvas.draw()
+    pixels = np.asarray(canvas.buffer_rgba()).copy()
+    fig.dpi = figure_dpi
+    if pool is not None:
+        pool.release(fig)
+    return pixels
+
+
+def encode_image(pixels, image_format='png', compress_level=6, jpeg_quality=90, quantize_colors=None):
+    """
+    Encodes RGBA pixels as PNG (zlib compress_level 0-9) or JPEG (jpeg_quality 1-95) bytes. With quantize_colors,
+    PNGs are reduced to a palette of that many colors, which shrinks flat-colored plots several times over.
+    """
+    image = Image.fromarray(pixels)
+    img_stream = BytesIO()
+    if image_format == 'jpeg':
+        image.convert('RGB').save(img_stream, format='JPEG', quality=jpeg_quality)
+    elif quantize_colors is not None:
+        palette = image.convert('RGB').quantize(colors=quantize_colors, method=Image.Quantize.FASTOCTREE)
+        palette.save(img_stream, format='PNG', compress_level=compress_level)
+    else:
+        image.save(img_stream, format='PNG', compress_level=compress_level)
+    return img_stream.getvalue()
+
+
+def validate_image_options(image_format, slide_dpi=None, quantize_colors=None):
+    """Raises ValueError unless the slide image options shared by the batch reports are valid."""
+    if image_format not in ('png', 'jpeg'):
+        raise ValueError("image_format should be either 'png' or 'jpeg'.")
+
+    if slide_dpi is not None and (not isinstance(slide_dpi, (int, float)) or slide_dpi <= 0):
+        raise ValueError("slide_dpi should be None or a positive number.")
+
+    if quantize_colors is not None and (not isinstance(quantize_colors, int) or not 2 <= quantize_colors <= 256):
+        raise ValueError("quantize_colors should be None or an integer from 2 to 256.")
+
+
+class EncodingPipeline:
+    """
+    Adds figures to a StreamingDeck while encoding them on a thread pool.
+
+    The calling thread only rasterizes each figure; compression (which releases the GIL) runs in max_workers
+    threads, so drawing the next figure overlaps with encoding the previous ones. Slides are added to the deck in
+    the order figures were submitted, and at most 2 * max_workers rasterized figures are held at a time. Figures from
+    figure_pool go back to the pool once rasterized. With slide_dpi set, figures are rasterized at the resolution
+    giving slide_dpi pixels per inch of the picture on the slide rather than at their own dpi.
+    """
+
+    def __init__(self, deck, max_workers=None, image_format='png', compress_level=6, jpeg_quality=90, figure_pool=None,
+                 slide_dpi=None, quantize_colors=None):
+        validate_image_options(image_format, slide_dpi, quantize_colors)
+        self.deck = deck
+        self.figure_pool = figure_pool
+        self.slide_dpi = slide_dpi
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.encode_kwargs = dict(image_format=image_format, compress_level=compress_level, jpeg_quality=jpeg_quality,
+                                  quantize_colors=quantize_colors)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._pending = deque()
+
+    def add(self, plot, left, top, width, height, key=None, on_encoded=None):
+        """
+        Queues a slide showing plot, a matplotlib Figure or already encoded image bytes.
+
+        on_encoded, if given, is called with the image bytes from the calling thread once the slide is added.
+        """
+        if isinstance(plot, bytes):
+            future = Future()
+            future.set_result(plot)
+        else:
+            dpi = None if self.slide_dpi is None else slide_image_dpi(plot, width, self.slide_dpi)
+            pixels = rasterize_figure(plot, self.figure_pool, dpi)
+            future = self._executor.submit(encode_image, pixels, **self.encode_kwargs)
+        self._pending.append((future, (left, top, width, height), key, on_encoded))
+        while self._pending and (len(self._pending) > 2 * self.max_workers or self._pending[0][0].done()):
+            self._add_next()
+
+    def _add_next(self):
+        future, position, key, on_encoded = self._pending.popleft()
+        image = future.result()
+        self.deck.add_picture_slide(BytesIO(image), *position, ext=self.encode_kwargs['image_format'], key=key)
+        if on_encoded is not None:
+            on_encoded(image)
+
+    def close(self):
+        """Waits for every queued slide to be encoded and added to the deck."""
+        while self._pending:
+            self._add_next()
+        self._executor.shutdown()
+
+
+class ImageCache:
+    """
+    On-disk cache of rendered slide images keyed by a hex digest, evicting the least recently used images once the
+    cache holds more than max_bytes.
+
+    The directory is scanned once when the cache is opened; after that the use order and total size are tracked in
+    memory, so storing an image does not rescan the directory. File modification times record the use order for
+    the next run.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 2**20, ext='png'):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ext = ext
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and entry.name.endswith(f'.{ext}'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(ext) - 1], stat.st_size))
+        # Image sizes by key, least recently used first.
+        self._sizes = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._total = sum(self._sizes.values())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.{self.ext}')
+
+    def _touch(self, key):
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            self._total -= self._sizes.pop(key, 0)
+            return False
+        if key in self._sizes:
+            self._sizes.move_to_end(key)
+        return True
+
+    def __contains__(self, key):
+        # Checking for a key counts as a use, so images about to be reused are the last to be evicted.
+        return self._touch(key)
+
+    def get(self, key):
+        """Returns the cached image bytes for key, or None on a miss."""
+        try:
+            with open(self._path(key), 'rb') as f:
+                image = f.read()
+        except FileNotFoundError:
+            self._total -= self._sizes.pop(key, 0)
+            return None
+        self._touch(key)
+        return image
+
+    def put(self, key, image):
+        """Stores image under key and evicts old images if the cache grew past max_bytes."""
+        path = self._path(key)
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(image)
+        os.replace(f'{path}.tmp', path)
+        self._total += len(image) - self._sizes.pop(key, 0)
+        self._sizes[key] = len(image)
+        self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._sizes:
+            key, size = self._sizes.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+def cache_key(*parts):
+    """Builds an ImageCache key from the repr of the render parameters and raw bytes of content hashes."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def column_digest(column):
+    """Hashes the values and dtype of a column, ignoring its index."""
+    hashes = pd.util.hash_pandas_object(column, index=False).to_numpy()
+    return hashlib.sha256(hashes.tobytes() + str(column.dtype).encode('utf-8')).digest()
+
+
+def _object_pointers(values):
+    """The addresses of the objects held by an object array, read as integers without touching the objects."""
+    interface = dict(values.__array_interface__, typestr=np.dtype(np.intp).str, descr=[('', np.dtype(np.intp).str)])
+    return np.asarray(types.SimpleNamespace(__array_interface__=interface, base=values))
+
+
+def _column_fingerprint(column):
+    """
+    Cheap content fingerprint of a column.
+
+    Numeric columns are fingerprinted by a CRC of their raw values and categoricals by a CRC of their codes. Columns
+    of Python objects (including Python-backed strings) get a CRC of the addresses of their values, which changes
+    whenever a value is replaced but not when a mutable value such as a list is modified in place. Other columns
+    fall back to column_digest.
+    """
+    dtype = column.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        codes = np.ascontiguousarray(column.cat.codes.to_numpy())
+        return 'category', dtype.ordered, zlib.crc32(codes), column_digest(pd.Series(dtype.categories))
+    if dtype == object or getattr(dtype, 'storage', None) == 'python':
+        values = column.to_numpy()
+        return str(dtype), len(values), zlib.crc32(np.ascontiguousarray(_object_pointers(values)))
+    values = column.to_numpy()
+    if values.dtype.kind in 'biufcmM':
+        return values.dtype.str, zlib.crc32(np.ascontiguousarray(values))
+    return column_digest(column)
+
+
+def _capped_distinct_count(values, distinct_cap, first_chunk=4096):
+    """Counts distinct non-missing values, reading chunks of doubling size and stopping once distinct_cap is reached."""
+    seen = set()
+    start, size = 0, first_chunk
+    while start < len(values) and len(seen) < distinct_cap:
+        uniques = pd.unique(values[start:start + size])
+        seen.update(uniques[~pd.isna(uniques)])
+        start, size = start + size, size * 2
+    return min(len(seen), distinct_cap)
+
+
+def profile_columns(data, distinct_cap, refresh=False):
+    """
+    Profiles every column of data: dtype, min, max and a distinct count capped at distinct_cap.
+
+    Min and max are computed for all numeric columns in one vectorized reduction (NaN for other columns), and the
+    distinct count of a column stops scanning as soon as it reaches distinct_cap, so n_distinct == distinct_cap
+    means "at least distinct_cap". Profiles are cached per DataFrame and reused by later calls that need the same
+    or a lower cap. Every call fingerprints the columns, so a frame modified in place is profiled again, keeping the
+    distinct counts of the columns that did not change; refresh=True drops the cached profile regardless, which is
+    also needed after mutating objects held by a column in place.
+
+    Returns a DataFrame indexed by column name with columns dtype, min, max and n_distinct.
+    """
+    key = id(data)
+    entry = _profile_cache.get(key)
+    if refresh or entry is None or entry['frame']() is not data:
+        entry = {'frame': weakref.ref(data, lambda _, key=key: _profile_cache.pop(key, None)),
+                 'stats': None, 'counts': {}, 'fingerprints': {}}
+        _profile_cache[key] = entry
+    fingerprints = {col: _column_fingerprint(data.iloc[:, i]) for i, col in enumerate(data.columns)}
+    if entry['stats'] is None or list(entry['stats'].index) != list(data.columns) or fingerprints != entry['fingerprints']:
+        numeric = data.select_dtypes(include=['number', 'bool'])
+        entry['stats'] = pd.DataFrame({'dtype': data.dtypes,
+                                       'min': numeric.min().reindex(data.columns),
+                                       'max': numeric.max().reindex(data.columns)})
+        entry['counts'] = {col: count for col, count in entry['counts'].items()
+                           if entry['fingerprints'].get(col) == fingerprints.get(col)}
+        entry['fingerprints'] = fingerprints
+
+    counts = entry['counts']
+    n_distinct = []
+    for i, col in enumerate(data.columns):
+        count, cap = counts.get(col, (0, 0))
+        # A count below the cap it was computed with is exact; otherwise it is only a lower bound.
+        if count >= cap and cap < distinct_cap:
+            count, cap = _capped_distinct_count(data.iloc[:, i].to_numpy(), distinct_cap), distinct_cap
+            counts[col] = (count, cap)
+        n_distinct.append(min(count, distinct_cap))
+    return entry['stats'].assign(n_distinct=n_distinct)